@@ -1,89 +1,367 @@
 # app.py (修改 V5 - 添加开场动画)
 #   .chat-window { flex-grow: 1; overflow-y: auto; padding: 10px; background: rgba(0,0,0,0.2); border-radius: 10px; margin-top: 15px; display: flex; flex-direction: column; gap: 12px; }
-from flask import Flask, jsonify, request, render_template, redirect, url_for # 导入 redirect, url_for
+from flask import Blueprint, Flask, jsonify, request, render_template, redirect, url_for, g, current_app, Response, stream_with_context # 导入 redirect, url_for
 from flask_cors import CORS
+import hmac
 import os
-import openai
-from dotenv import load_dotenv
-from game.game_manager import GameManager
+import re
+import json
+import threading
+import time
+import uuid
+from game import metrics
 
-# --- 1. 初始化 ---
-app = Flask(__name__)
-CORS(app)
-load_dotenv()
+# pandas/numpy/openai 相关的模块都在第一次用到时才导入：只渲染页面的请求和进程启动不用为它们付出导入时间
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
-if not openai.api_key:
-    print("WARNING: OPENAI_API_KEY not found. Chat functionality will not be available.")
+def create_session_store():
+    """根据环境变量选择会话存储：SESSION_STORE=sqlite 时使用本地数据库文件，可在多个 worker 间共享"""
+    from game.session_store import InMemorySessionStore, SQLiteSessionStore
+    ttl = float(os.getenv("SESSION_TTL", 3600))
+    if os.getenv("SESSION_STORE", "memory").lower() == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_DB", "sessions.db"), ttl=ttl)
+    return InMemorySessionStore(capacity=int(os.getenv("SESSION_CAPACITY", 10000)), ttl=ttl)
 
-game_manager = GameManager(data_path='data/')
-SESSION_ID = "local_player"
+def create_coach():
+    """AI 教练；OpenAI 客户端随 GameManager 一起创建 (默认在后台预热线程里)，不在应用导入时创建"""
+    from game.ai_coach import CoachService
+    return CoachService(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL"),  # 可指向本地假补全服务做测试
+        timeout=float(os.getenv("COACH_TIMEOUT", 20)),
+        max_in_flight=int(os.getenv("COACH_MAX_IN_FLIGHT", 16)),
+    )
 
-# --- 2. API 路由 (保持不变) ---
-@app.route("/api/game_state", methods=["GET"])
+def create_action_log():
+    """ACTION_LOG_DIR 设置时记录每次操作 (事件溯源)，重启时从快照和日志恢复会话；未设置时不记录
+
+    日志目录只能由一个进程写入，多 worker 部署时每个 worker 用各自的目录。
+    """
+    directory = os.getenv("ACTION_LOG_DIR")
+    if not directory:
+        return None
+    import atexit
+    from game.action_log import ActionLog
+    log = ActionLog(directory, flush_interval=float(os.getenv("ACTION_LOG_FLUSH_MS", 50)) / 1000,
+                    snapshot_every=int(os.getenv("ACTION_LOG_SNAPSHOT_EVERY", 100)))
+    # 正常退出时把还在队列里的记录写完
+    atexit.register(log.close)
+    return log
+
+class LazyGameManager:
+    """第一次访问时才加载行情并创建 GameManager；warm_up() 可以提前在后台线程里加载"""
+
+    def __init__(self, data_path='data/'):
+        self.data_path = data_path
+        self._lock = threading.Lock()
+        self._manager = None
+        self._listeners = []
+
+    @property
+    def loaded(self):
+        return self._manager is not None
+
+    def get(self):
+        manager = self._manager
+        if manager is None:
+            with self._lock:
+                if self._manager is None:
+                    from game.game_manager import GameManager
+                    from game.ttl_cache import TTLCache
+                    chat_cache = TTLCache(maxsize=int(os.getenv("CHAT_CACHE_SIZE", 2048)), ttl=float(os.getenv("CHAT_CACHE_TTL", 600)))
+                    manager = GameManager(data_path=self.data_path, session_store=create_session_store(),
+                                          coach=create_coach(), chat_cache=chat_cache,
+                                          action_log=create_action_log())
+                    manager.listeners.extend(self._listeners)
+                    self._manager = manager
+                manager = self._manager
+        return manager
+
+    def add_listener(self, listener):
+        """登记会话变化回调；GameManager 还没创建时先记下，创建时再挂上去"""
+        with self._lock:
+            if self._manager is None:
+                self._listeners.append(listener)
+            else:
+                self._manager.listeners.append(listener)
+
+    def warm_up(self):
+        thread = threading.Thread(target=self.get, name="game-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+def get_game_manager():
+    return current_app.extensions["game_manager"].get()
+
+api = Blueprint("legacy_guardian", __name__)
+
+SESSION_COOKIE = "lg_session"
+SESSION_HEADER = "X-Session-ID"
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def current_session_id():
+    """从请求头或 cookie 中取会话 ID，没有的话生成一个新的，并在响应里写回 cookie"""
+    if "session_id" not in g:
+        session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+        if not session_id or not SESSION_ID_PATTERN.match(session_id):
+            session_id = uuid.uuid4().hex
+        g.session_id = session_id
+    return g.session_id
+
+@api.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    profiler = current_app.extensions.get("profiler")
+    if profiler is not None:
+        g.profile_started = profiler.begin()
+
+@api.after_app_request
+def record_request_metrics(response):
+    rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    started = g.get("request_started")
+    if started is not None:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, rule, request.method, response.status_code)
+    return response
+
+@api.teardown_app_request
+def finish_profile(exc):
+    profiler = current_app.extensions.get("profiler")
+    if profiler is not None and "profile_started" in g:
+        path = profiler.end(g.profile_started, f"{request.method} {request.path}")
+        if path:
+            print(f"Slow request profile written to {path}")
+
+@api.after_app_request
+def persist_session_cookie(response):
+    session_id = g.get("session_id")
+    if session_id and request.cookies.get(SESSION_COOKIE) != session_id:
+        response.set_cookie(SESSION_COOKIE, session_id, max_age=30 * 24 * 3600, httponly=True, samesite="Lax")
+    return response
+
+# --- 2. API 路由 ---
+def state_etag(version, level):
+    return f"v{version}-l{level}"
+
+@api.route("/api/game_state", methods=["GET"])
 def get_game_state():
-    state = game_manager.get_game_state(SESSION_ID)
-    return jsonify(state)
+    session_id = current_session_id()
+    # 客户端通过 ?since=<上次的天数>&level=<上次的关卡> 请求增量数据
+    since_day = request.args.get("since", type=int)
+    since_level = request.args.get("level", type=int)
+    if request.method == "GET" and request.if_none_match:
+        # 状态没变时直接 304，不用重新构建整个状态
+        version, level = get_game_manager().get_state_version(session_id)
+        if request.if_none_match.contains(state_etag(version, level)):
+            response = current_app.response_class(status=304)
+            response.set_etag(state_etag(version, level))
+            return response
+    state = get_game_manager().get_game_state(session_id, since_day, since_level)
+    with metrics.stage("serialization"):
+        response = jsonify(state)
+    response.set_etag(state_etag(state["version"], state["currentLevel"]))
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
-@app.route("/api/perform_action", methods=["POST"])
+@api.route("/api/perform_action", methods=["POST"])
 def perform_action():
     action_data = request.json
-    result = game_manager.handle_action(SESSION_ID, action_data)
+    result = get_game_manager().handle_action(current_session_id(), action_data)
     if result.get("success"):
         return get_game_state()
     else:
         return jsonify({"error": result.get("message", "Unknown error")}), 400
 
-@app.route("/api/advance_level", methods=["POST"])
+@api.route("/api/batch_action", methods=["POST"])
+def batch_action():
+    """一次请求提交多笔买卖：{"orders": [{"action": "buy", "ticker": "TECH_A", "quantity": 5}, ...]}"""
+    orders = (request.json or {}).get("orders")
+    result = get_game_manager().handle_batch(current_session_id(), orders)
+    if result.get("success"):
+        return get_game_state()
+    else:
+        return jsonify({"error": result.get("message", "Unknown error")}), 400
+
+@api.route("/api/level1/projection", methods=["GET"])
+def level_one_projection():
+    """第一关存款推演：?horizon=<天数> (默认 730)"""
+    horizon = request.args.get("horizon", default=730, type=int)
+    result = get_game_manager().get_projection(current_session_id(), horizon)
+    if result.pop("success"):
+        return jsonify(result)
+    else:
+        return jsonify({"error": result.get("message", "Projection unavailable.")}), 400
+
+@api.route("/api/advance_level", methods=["POST"])
 def advance_level():
-    result = game_manager.advance_level(SESSION_ID)
+    result = get_game_manager().advance_level(current_session_id())
     if result.get("success"):
         return get_game_state()
     else:
         return jsonify({"error": result.get("message", "Failed to move to next level.")}), 400
 
-@app.route("/api/reset", methods=["POST"])
+@api.route("/api/reset", methods=["POST"])
 def reset():
-    game_manager.start_new_session(SESSION_ID)
+    get_game_manager().start_new_session(current_session_id())
     return get_game_state()
 
-@app.route("/api/chat", methods=["POST"])
+@api.route("/api/chat", methods=["POST"])
 def chat():
     user_message = request.json.get("message")
-    response = game_manager.handle_chat(SESSION_ID, user_message)
+    session_id = current_session_id()
+    # ?stream=1 或 Accept: text/event-stream 时用 SSE 边生成边返回
+    if request.args.get("stream") == "1" or "text/event-stream" in request.headers.get("Accept", ""):
+        chunks = get_game_manager().stream_chat(session_id, user_message)
+        def events():
+            for chunk in chunks:
+                yield f"data: {json.dumps({'delta': chunk})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        return Response(stream_with_context(events()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response = get_game_manager().handle_chat(session_id, user_message)
     return jsonify(response)
 
+@api.route("/api/leaderboard", methods=["GET"])
+def leaderboard():
+    """按总资产排名的班级排行榜：?limit=<人数> (默认 10，最多 100)&offset=<跳过的名次>"""
+    limit = min(max(request.args.get("limit", default=10, type=int), 1), 100)
+    offset = max(request.args.get("offset", default=0, type=int), 0)
+    return jsonify(get_game_manager().get_leaderboard(current_session_id(), limit, offset))
+
+@api.route("/api/push_info", methods=["GET"])
+def push_info():
+    """前端据此决定是否连接推送服务 (SSE)"""
+    push_url = current_app.config.get("PUSH_URL")
+    return jsonify({"enabled": bool(push_url), "url": push_url})
+
+@api.route("/api/teacher/advance_all", methods=["POST"])
+def teacher_advance_all():
+    """老师让所有第二、三关的玩家前进一天；需要 X-Teacher-Token 与环境变量 TEACHER_TOKEN 一致"""
+    token = os.getenv("TEACHER_TOKEN")
+    if not token:
+        return jsonify({"error": "Teacher controls are disabled."}), 403
+    # 常数时间比较，避免通过响应时间逐字节猜出口令
+    if not hmac.compare_digest(request.headers.get("X-Teacher-Token", "").encode(), token.encode()):
+        return jsonify({"error": "Invalid teacher token."}), 403
+    return jsonify({"advanced": get_game_manager().advance_all()})
+
+@api.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus 抓取接口：请求和各处理阶段的耗时直方图，以及会话数、缓存命中率、AI 在途请求数"""
+    lazy = current_app.extensions["game_manager"]
+    samples = [("lg_game_data_loaded", "gauge", "Whether market data and the game manager are loaded.",
+                [({}, int(lazy.loaded))])]
+    if lazy.loaded:
+        manager = lazy.get()
+        caches = {"chat": manager.chat_cache, "advice": manager.advice_cache}
+        samples += [
+            ("lg_active_sessions", "gauge", "Sessions currently held by the session store.", [({}, len(manager.sessions))]),
+            ("lg_leaderboard_players", "gauge", "Sessions ranked on the leaderboard.", [({}, len(manager.leaderboard))]),
+            ("lg_coach_in_flight", "gauge", "AI coach completions currently running.", [({}, manager.coach.in_flight)]),
+            ("lg_cache_hits_total", "counter", "Cache hits.", [({"cache": n}, c.hits) for n, c in caches.items()]),
+            ("lg_cache_misses_total", "counter", "Cache misses.", [({"cache": n}, c.misses) for n, c in caches.items()]),
+            ("lg_cache_hit_ratio", "gauge", "Cache hit ratio since start.", [({"cache": n}, c.hit_ratio) for n, c in caches.items()]),
+            ("lg_cache_entries", "gauge", "Entries currently cached.", [({"cache": n}, len(c)) for n, c in caches.items()]),
+        ]
+    hub = current_app.extensions.get("push_hub")
+    if hub is not None:
+        samples.append(("lg_push_connections", "gauge", "Open server-push connections.", [({}, hub.connections)]))
+    return Response(metrics.render(samples), mimetype="text/plain; version=0.0.4")
+
 # --- 3. 页面渲染路由 (新增和修改的部分) ---
-@app.route("/")
+@api.route("/")
 def home_redirect():
     """根路由现在重定向到开场动画"""
-    return redirect(url_for('intro_animation')) # 重定向到开场动画页面
+    return redirect(url_for('.intro_animation')) # 重定向到开场动画页面
 
-@app.route("/intro")
+@api.route("/intro")
 def intro_animation():
     """渲染开场动画页面"""
     return render_template("intro_animation.html")
 
-@app.route("/game_main") # 修改了原来 / 的路由，现在它是游戏主页
+@api.route("/game_main") # 修改了原来 / 的路由，现在它是游戏主页
 def index():
     """渲染游戏主页，开场动画结束后会跳转到这里"""
     return render_template("index.html")
 
-@app.route("/game/part1")
+@api.route("/game/part1")
 def game_part1():
     """渲染游戏的第一和第二部分页面"""
     return render_template("game_part1.html")
 
-@app.route("/game/part2")
+@api.route("/game/part2")
 def game_part2():
     """渲染游戏的第三部分页面"""
     return render_template("game_part2.html")
 
 
-# --- 4. 启动服务器 ---
-if __name__ == "__main__":
-    game_manager.start_new_session(SESSION_ID)
+# --- 4. 应用工厂 ---
+def create_app(data_path='data/', warm_up=None, push=None):
+    """创建 Flask 应用。只做轻量的配置，行情和 AI 客户端都延迟到第一次使用时初始化
+
+    warm_up 为 True 时在后台线程里提前加载行情 (默认读环境变量 WARM_UP，未设置时开启)。
+    push 为 True 时启动 SSE 推送服务 (默认看环境变量 PUSH_ENABLED 是否为 1，未设置时不启动)，
+    监听 PUSH_HOST:PUSH_PORT；gunicorn 等多 worker 部署时每个 worker 需要各自的 PUSH_PORT。
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    app = Flask(__name__)
+    CORS(app)
+    app.register_blueprint(api)
+    if not os.getenv("OPENAI_API_KEY"):
+        print("WARNING: OPENAI_API_KEY not found. Chat functionality will not be available.")
+    app.extensions["game_manager"] = LazyGameManager(data_path)
+    # PROFILE_SLOW_MS 设置后开启采样分析器，超过该耗时的请求把调用栈写到 PROFILE_DIR (collapsed stack 格式)
+    app.extensions["profiler"] = None
+    if os.getenv("PROFILE_SLOW_MS"):
+        from game.profiler import SamplingProfiler
+        app.extensions["profiler"] = SamplingProfiler(
+            output_dir=os.getenv("PROFILE_DIR", "profiles"), slow_seconds=float(os.getenv("PROFILE_SLOW_MS")) / 1000,
+            interval=float(os.getenv("PROFILE_INTERVAL_MS", 5)) / 1000)
+    if warm_up is None:
+        warm_up = os.getenv("WARM_UP", "1") != "0"
+    if warm_up:
+        app.extensions["game_manager"].warm_up()
+    if push is None:
+        push = os.getenv("PUSH_ENABLED", "0") == "1"
+    if push:
+        try:
+            start_push_server(app)
+        except OSError as e:
+            # 端口被占用等情况：前端拿不到 PUSH_URL，退回到轮询
+            print(f"Could not start the push server: {e}")
+    return app
+
+def start_push_server(app, host=None, port=None):
+    """在后台事件循环里启动 SSE 推送服务，会话变化时把增量状态推给已连接的浏览器
 
+    推送服务和 GameManager 在同一个进程里；多 worker 部署时每个 worker 各自推送自己处理的会话。
+    只接受来自游戏页面的跨域连接：PUSH_ALLOWED_ORIGINS (逗号分隔)，默认是本机的 5002 端口。
+    """
+    from game.push_hub import PushHub, PushServer
+    lazy = app.extensions["game_manager"]
+    host = host or os.getenv("PUSH_HOST", "127.0.0.1")
+    port = int(port or os.getenv("PUSH_PORT", 5003))
+    hub = PushHub(lazy.get)
+    lazy.add_listener(hub.notify)
+    origins = os.getenv("PUSH_ALLOWED_ORIGINS", "http://127.0.0.1:5002,http://localhost:5002")
+    server = PushServer(hub, host, port, session_pattern=SESSION_ID_PATTERN, cookie_name=SESSION_COOKIE,
+                        allowed_origins=[o.strip() for o in origins.split(",") if o.strip()])
+    server.start().result()
+    app.extensions["push_hub"] = hub
+    app.config["PUSH_URL"] = os.getenv("PUSH_PUBLIC_URL", f"http://{host}:{port}/events")
+    print(f"Push server is running on: http://{host}:{port}/events")
+    return server
+
+def _push_default():
+    """直接运行 python app.py (开发模式) 时默认开启推送；debug reloader 的父进程只负责监视文件，
+    推送服务只在真正处理请求的子进程里启动。其他情况 (gunicorn 等) 由 create_app 读取 PUSH_ENABLED"""
+    if __name__ != "__main__":
+        return None
+    return os.getenv("WERKZEUG_RUN_MAIN") == "true" and os.getenv("PUSH_ENABLED", "1") == "1"
+
+app = create_app(push=_push_default())
+
+# --- 5. 启动服务器 ---
+if __name__ == "__main__":
     print("\n========================= Legacy Guardian - Game Start Guide =========================")
     print("Backend services and page rendering have all started!")
     print(f"Service is running on: http://127.0.0.1:5002")
@@ -0,0 +1,199 @@
+# benchmarks/load.py
+# 负载测试：N 个并发模拟玩家反复请求 /api/game_state、/api/perform_action 和 /api/chat，统计延迟分位数和吞吐量
+# 默认在进程内用 Flask test client 驱动 app (AI 教练接本地假补全服务)；--url 时改为请求一个正在运行的服务器
+# 用法 (在 LegacyGuardiansGameold7 目录下): python benchmarks/load.py --players 50 --duration 20 [--json out.json]
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+QUESTIONS = ["Should I diversify?", "Is now a good time to buy TECH_A?", "What should I do with my cash?",
+             "How risky is my portfolio?"]
+
+
+class InProcessClient:
+    """每个玩家一个 Flask test client，通过 X-Session-ID 区分会话"""
+
+    def __init__(self, app, session_id):
+        self.client = app.test_client()
+        self.headers = {"X-Session-ID": session_id}
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body, headers=self.headers)
+        response.get_data()
+        return response.status_code
+
+
+class HttpClient:
+    """请求正在运行的服务器，每个玩家一个长连接"""
+
+    def __init__(self, url, session_id):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+        self.headers = {"X-Session-ID": session_id, "Content-Type": "application/json"}
+
+    def request(self, method, path, body=None):
+        self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=self.headers)
+        response = self.conn.getresponse()
+        response.read()
+        return response.status
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, client, name, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status = client.request(method, path, body)
+        except (OSError, http.client.HTTPException):
+            status = None
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if status is None or status >= 500:
+                self.errors[name] += 1
+        return status
+
+
+def player(client, recorder, deadline, rng, chat_every):
+    """一名玩家：重置后进入第二关买卖几天，再进入第三关交易并偶尔提问；到时间后停止"""
+    turn = 0
+    while time.perf_counter() < deadline:
+        recorder.call(client, "reset", "POST", "/api/reset")
+        recorder.call(client, "advance_level", "POST", "/api/advance_level")
+        for _ in range(rng.randint(3, 8)):
+            recorder.call(client, "game_state", "GET", "/api/game_state")
+            action = rng.choice([{"action": "buy", "quantity": 1}, {"action": "next_day"}])
+            recorder.call(client, "perform_action", "POST", "/api/perform_action", action)
+        recorder.call(client, "advance_level", "POST", "/api/advance_level")
+        while time.perf_counter() < deadline:
+            turn += 1
+            recorder.call(client, "game_state", "GET", "/api/game_state")
+            action = rng.choice([
+                {"action": "buy", "ticker": rng.choice(["TECH_A", "ENERGY_A", "HEALTH_B", "AGRI_A"]), "quantity": 1},
+                {"action": "next_day"},
+            ])
+            recorder.call(client, "perform_action", "POST", "/api/perform_action", action)
+            if chat_every and turn % chat_every == 0:
+                recorder.call(client, "chat", "POST", "/api/chat", {"message": rng.choice(QUESTIONS)})
+            if rng.random() < 0.05:
+                break  # 偶尔重新开始一局
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    total = 0
+    for name, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        total += len(values)
+        endpoints[name] = {
+            "count": len(values),
+            "errors": recorder.errors.get(name, 0),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": values[-1] * 1000,
+            "throughput_rps": len(values) / elapsed,
+        }
+    return {"elapsedSeconds": elapsed, "requests": total, "throughput_rps": total / elapsed, "endpoints": endpoints}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_coach(latency, token_delay):
+    """启动 tools/fake_completion_server.py，返回 (进程, base_url)"""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "tools", "fake_completion_server.py"),
+                                "--port", str(port), "--latency", str(latency), "--token-delay", str(token_delay)],
+                               stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent player load generator for the game API.")
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--chat-every", type=int, default=10, help="ask the coach every N level 3 turns (0: never)")
+    parser.add_argument("--coach-latency", type=float, default=0.05, help="fake coach seconds before first token")
+    parser.add_argument("--coach-token-delay", type=float, default=0.0)
+    parser.add_argument("--url", help="drive a running server instead of an in-process app")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    fake_coach = None
+    if args.url:
+        make_client = lambda i: HttpClient(args.url, f"load{i}")
+    else:
+        # 进程内模式：AI 教练指向本地假补全服务，不消耗 API 额度
+        fake_coach, base_url = start_fake_coach(args.coach_latency, args.coach_token_delay)
+        os.environ.update(OPENAI_API_KEY="load-test", OPENAI_BASE_URL=base_url, WARM_UP="0")
+        import app as server
+        app = server.app
+        app.extensions["game_manager"].get()
+        make_client = lambda i: InProcessClient(app, f"load{i}")
+
+    recorder = Recorder()
+    try:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        threads = [threading.Thread(target=player, args=(make_client(i), recorder, deadline,
+                                                         random.Random(args.seed + i), args.chat_every), daemon=True)
+                   for i in range(args.players)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if fake_coach is not None:
+            fake_coach.terminate()
+
+    result = summarize(recorder, elapsed)
+    result.update(benchmark="load", timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), players=args.players,
+                  mode="http" if args.url else "in-process", python=platform.python_version())
+    print(f"{args.players} players, {elapsed:.1f} s, {result['requests']} requests, {result['throughput_rps']:.0f} req/s")
+    print(f"{'endpoint':<16}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for name, e in result["endpoints"].items():
+        print(f"{name:<16}{e['count']:>8}{e['errors']:>8}{e['p50_ms']:>10.2f}{e['p95_ms']:>10.2f}"
+              f"{e['p99_ms']:>10.2f}{e['throughput_rps']:>10.1f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/micro.py
+# 关卡热点函数的微基准：在不同规模的合成行情上测量每次调用的耗时
+# 用法 (在 LegacyGuardiansGameold7 目录下): python benchmarks/micro.py [--sizes 60x8,1260x200] [--json out.json] [--compare old.json]
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from game import level_two_stock, level_three_portfolio, portfolio_history
+from game.market_data import AssetCatalog
+from game.market_generator import generate_market
+from game.missions import index_missions_by_day
+from game.session import GameSession
+from game.ttl_cache import TTLCache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = "60x8,252x50,1260x200,2520x500"
+
+
+def measure(fn, repeat=3):
+    """返回每次调用耗时的中位数 (微秒)；每轮调用次数由 timeit 自动确定 (每轮约 0.2 秒)"""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    runs = timer.repeat(repeat=repeat, number=number)
+    return float(np.median(runs)) / number * 1e6
+
+
+def build_session(market, level, holdings_per_ticker=5):
+    """玩到最后一天、每只股票都持有一些的会话 (持仓日志覆盖每一天)"""
+    session = GameSession(len(market.tickers), level=level)
+    session.holdings[:] = holdings_per_ticker
+    session.cash = 5000.0
+    session.day = len(market) - 1
+    portfolio_history.record(session, market)
+    return session
+
+
+def bench_size(assets_df, missions_df, days, tickers, seed=0):
+    assets_df, market = generate_market(assets_df, days, tickers, seed=seed)
+    assets = AssetCatalog(assets_df, market)
+    missions_by_day = index_missions_by_day(missions_df)
+    day = len(market) - 1
+    session = build_session(market, 3)
+    holdings = {"_cash": session.cash, **session.holdings_dict(market.tickers)}
+    warm_cache = TTLCache(maxsize=16, ttl=None)
+    level_three_portfolio.get_ai_coach_advice(holdings, day, market, warm_cache, session.holdings)
+
+    cases = {
+        "calculate_portfolio_value": lambda: level_three_portfolio.calculate_portfolio_value(holdings, day, market),
+        "get_history_for_chart/recompute": lambda: level_three_portfolio.get_history_for_chart(holdings, day, market),
+        "get_history_for_chart/history": lambda: level_three_portfolio.get_history_for_chart(
+            holdings, day, market, session.history),
+        "get_ai_coach_advice/uncached": lambda: level_three_portfolio.get_ai_coach_advice(holdings, day, market),
+        "get_ai_coach_advice/cached": lambda: level_three_portfolio.get_ai_coach_advice(
+            holdings, day, market, warm_cache, session.holdings),
+        "level_two.get_level_state/full": lambda: level_two_stock.get_level_state(session, market, assets),
+        "level_two.get_level_state/delta": lambda: level_two_stock.get_level_state(session, market, assets, day - 1),
+        "level_three.get_level_state/full": lambda: level_three_portfolio.get_level_state(
+            session, market, assets, missions_by_day, warm_cache),
+        "level_three.get_level_state/delta": lambda: level_three_portfolio.get_level_state(
+            session, market, assets, missions_by_day, warm_cache, day - 1),
+    }
+    return {name: measure(fn) for name, fn in cases.items()}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the level hot paths.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated DAYSxTICKERS")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    args = parser.parse_args()
+
+    assets_df = pd.read_csv(os.path.join(ROOT, "data", "mock_assets.csv"))
+    missions_df = pd.read_csv(os.path.join(ROOT, "data", "missions_catalog.csv"))
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+
+    results = {}
+    for size in args.sizes.split(","):
+        days, tickers = (int(x) for x in size.lower().split("x"))
+        results[size] = bench_size(assets_df, missions_df, days, tickers, args.seed)
+        print(f"\n== {days} days x {tickers} tickers ==")
+        for name, us in results[size].items():
+            line = f"{name:<36} {us:12.2f} us"
+            old = previous.get(size, {}).get(name)
+            if old:
+                line += f"   ({us / old:5.2f}x vs {old:.2f} us)"
+            print(line)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "benchmark": "micro",
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "unit": "microseconds per call (median)",
+                "results": results,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
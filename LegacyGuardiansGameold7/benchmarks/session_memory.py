@@ -0,0 +1,98 @@
+# benchmarks/session_memory.py
+# 对比 旧的 dict 会话 和 GameSession (__slots__) 在相同状态下的单会话内存占用，
+# 再单独列出组合历史 (持仓日志) 的开销：用真实玩过的会话测量，第三关随机交易若干天
+# 用法 (在 LegacyGuardiansGameold7 目录下): python benchmarks/session_memory.py [--sessions 10000] [--size 2520x500]
+import argparse
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from game import level_three_portfolio
+from game.market_cache import load_market
+from game.market_generator import generate_market
+from game.session import GameSession
+from game.simulation import new_session, random_trader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def legacy_session(i, tickers):
+    """改造前 start_new_session 创建的 dict，并模拟持有几只股票 (改造前没有持仓日志)"""
+    return {
+        "current_level": 3,
+        "principal": 10000.0 + i,
+        "interest_earned": 0.0,
+        "day": i,
+        "cash": 10000.0 - i,
+        "holdings": {t: (i + k) % 7 for k, t in enumerate(tickers[:4])},
+    }
+
+
+def slots_session(i, tickers):
+    """和 legacy_session 相同状态的 GameSession：持仓按列存成定长数组，不带历史"""
+    session = GameSession(len(tickers), level=3, day=i, cash=10000.0 - i, principal=10000.0 + i)
+    for k in range(min(4, len(tickers))):
+        session.holdings[k] = (i + k) % 7
+    return session
+
+
+def played_session(market, days, seed):
+    """第三关从第 0 天玩到第 days 天：每天以 30% 的概率随机买卖一只股票，然后进入下一天"""
+    rng = random.Random(seed)
+    tickers = list(market.tickers)
+    session = new_session(market, level=3)
+    for _ in range(days):
+        for order in random_trader(session, market, tickers, rng):
+            level_three_portfolio.handle_action(session, order, market)
+        level_three_portfolio.handle_action(session, {"action": "next_day"}, market)
+    return session
+
+
+def measure(factory, count):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions = [factory(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    # 扣掉保存会话的列表本身
+    total -= sys.getsizeof(sessions)
+    return total / count, sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-session memory of the game state.")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--size", help="DAYSxTICKERS synthetic market (default: the game's data/)")
+    args = parser.parse_args()
+
+    if args.size:
+        days, tickers = (int(x) for x in args.size.lower().split("x"))
+        _, market = generate_market(pd.read_csv(os.path.join(ROOT, "data", "mock_assets.csv")), days, tickers, seed=0)
+    else:
+        _, _, market = load_market(os.path.join(ROOT, "data"))
+    last_day = len(market) - 1
+    # 会话分布在整局游戏的各个阶段，平均玩到一半
+    play = lambda i: played_session(market, i % (last_day + 1), i)
+
+    legacy, _ = measure(lambda i: legacy_session(i, market.tickers), args.sessions)
+    slots, _ = measure(lambda i: slots_session(i, market.tickers), args.sessions)
+    played, sessions = measure(play, args.sessions)
+    serialized = sum(len(s.to_bytes()) for s in sessions) / args.sessions
+    changes = sum(s.history.changes for s in sessions if s.history is not None) / args.sessions
+    print(f"Sessions: {args.sessions} ({len(market)} days x {len(market.tickers)} tickers)")
+    print(f"  dict session                 : {legacy:10.1f} bytes/session")
+    print(f"  GameSession (__slots__)      : {slots:10.1f} bytes/session ({slots / legacy - 1:+.0%} vs dict)")
+    print(f"  + portfolio history          : {played - slots:10.1f} bytes/session "
+          f"(played sessions, on average {changes:.1f} holding changes)")
+    print(f"  played GameSession total     : {played:10.1f} bytes/session ({played * args.sessions / 1e6:.2f} MB total)")
+    print(f"  to_bytes() payload           : {serialized:10.1f} bytes/session")
+
+
+if __name__ == "__main__":
+    main()
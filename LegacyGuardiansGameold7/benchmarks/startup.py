@@ -0,0 +1,87 @@
+# benchmarks/startup.py
+# 测量服务器冷启动时间：导入 app.py、第一个页面请求、第一个游戏 API 请求 (触发行情加载)
+# 每轮都在新的 Python 进程里跑；任何一项中位数超过预算时退出码为 1，可以放进 CI
+# 用法 (在 LegacyGuardiansGameold7 目录下): python benchmarks/startup.py [--runs 5] [--import-budget-ms 300] [--api-budget-ms 1500]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, time
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get("/intro")
+page = time.perf_counter()
+client.get("/api/game_state")
+api = time.perf_counter()
+print(json.dumps({
+    "first_page_ms": (page - imported) * 1000,
+    "first_api_ms": (api - page) * 1000,
+}))
+"""
+
+IMPORT_ONLY = r"""
+import json, sys, time
+started = time.perf_counter()
+import app
+print(json.dumps({"import_ms": (time.perf_counter() - started) * 1000,
+                  "heavy_modules": sorted(m for m in ("pandas", "numpy", "openai") if m in sys.modules)}))
+"""
+
+
+def run_child(code, env):
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure and enforce the server cold-start time budget.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-ms", type=float, default=300.0)
+    parser.add_argument("--api-budget-ms", type=float, default=1500.0,
+                        help="budget for the first game API call, including the lazy market data load")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # 关闭后台预热，导入时间和第一次 API 调用的耗时才能分开测量
+    env = {**os.environ, "WARM_UP": "0"}
+    imports, runs = [], []
+    for _ in range(args.runs):
+        imports.append(run_child(IMPORT_ONLY, env))
+        runs.append(run_child(CHILD, env))
+
+    result = {
+        "runs": args.runs,
+        "import_ms": statistics.median(r["import_ms"] for r in imports),
+        "first_page_ms": statistics.median(r["first_page_ms"] for r in runs),
+        "first_api_ms": statistics.median(r["first_api_ms"] for r in runs),
+        "heavy_modules_at_import": imports[-1]["heavy_modules"],
+        "import_budget_ms": args.import_budget_ms,
+        "api_budget_ms": args.api_budget_ms,
+    }
+    print(f"import app:       {result['import_ms']:8.1f} ms  (budget {args.import_budget_ms:.0f} ms)")
+    print(f"first page:       {result['first_page_ms']:8.1f} ms")
+    print(f"first game API:   {result['first_api_ms']:8.1f} ms  (budget {args.api_budget_ms:.0f} ms)")
+    print(f"heavy modules imported by 'import app': {result['heavy_modules_at_import'] or 'none'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    over = []
+    if result["import_ms"] > args.import_budget_ms:
+        over.append("import")
+    if result["first_api_ms"] > args.api_budget_ms:
+        over.append("first game API")
+    if over:
+        print(f"FAILED: over budget ({', '.join(over)})")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# game/action_log.py
+# 事件溯源的操作日志：每次成功修改会话的操作追加一行到日志文件，后台线程攒批写入、一批只 fsync 一次；
+# 定期把会话快照 (GameSession.to_bytes) 写到 snapshots/，恢复时只需回放快照之后的日志尾部
+import functools
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+from game.session import GameSession, market_layout
+from game.simulation import apply_event, in_worker, market_pool
+
+LOG_NAME = "actions.log"
+SNAPSHOT_DIR = "snapshots"
+# 快照文件：快照对应的日志字节偏移 (之前的记录都已包含在快照里) + GameSession.to_bytes()
+_SNAPSHOT_HEADER = struct.Struct("<Q")
+# 会话 ID 同时用作快照文件名，也不能含有分隔符
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def format_record(session_id, version, kind, payload=None, stamp=None):
+    """一行日志：时间戳 \\t 会话 ID \\t 版本号 \\t 类型 (reset/action/batch/advance) \\t 操作内容 JSON"""
+    if not _SESSION_ID.match(session_id):
+        raise ValueError(f"Invalid session id for the action log: {session_id!r}")
+    body = json.dumps(payload, separators=(",", ":")) if payload is not None else ""
+    return f"{time.time() if stamp is None else stamp:.3f}\t{session_id}\t{version}\t{kind}\t{body}\n".encode()
+
+
+def _partition(session_id, parts):
+    """会话 ID (bytes) 所在的分区；同一会话的记录总在同一个分区里按顺序回放"""
+    return zlib.crc32(session_id) % parts
+
+
+def read_records(path, start=0, partition=None):
+    """从字节偏移 start 开始逐条产出 (会话 ID, 版本号, 类型, 操作内容, 时间戳)
+
+    没写完整的最后一行 (进程在写入中途退出) 会被忽略。partition=(第几个, 共几个) 时只产出
+    这个分区的会话，其余的行不解析。同一班级的操作高度重复，相同的操作内容只解析一次、
+    共享同一个 dict，规则函数只读取不修改它。
+    """
+    decode = functools.lru_cache(maxsize=4096)(json.loads)
+    part, parts = partition if partition is not None else (0, 1)
+    with open(path, "rb") as f:
+        f.seek(start)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            if parts > 1 and _partition(line.split(b"\t", 2)[1], parts) != part:
+                continue
+            stamp, session_id, version, kind, body = line[:-1].decode().split("\t")
+            yield session_id, int(version), kind, decode(body) if body else None, float(stamp)
+
+
+def replay(records, market, sessions=None):
+    """按顺序把操作记录作用到会话上，返回 (会话字典, 统计)
+
+    sessions 里已有的会话 (例如从快照恢复的) 只应用版本号更大的记录；
+    没有 reset 开头的会话 (开头在更早的日志里) 会被跳过。
+    """
+    sessions = {} if sessions is None else sessions
+    num_tickers = len(market.tickers)
+    applied = rejected = 0
+    last_seen = {}
+    for session_id, version, kind, payload, stamp in records:
+        session = sessions.get(session_id)
+        if session is not None and version <= session.version:
+            continue  # 快照已经包含这条记录
+        if kind == "reset":
+            sessions[session_id] = GameSession(num_tickers, version=version)
+        elif session is None:
+            continue
+        else:
+            if not apply_event(session, kind, payload, market).get("success"):
+                # 日志里只有成功的操作，回放失败说明行情数据和记录时不一致
+                rejected += 1
+            session.version = version
+        last_seen[session_id] = stamp
+        applied += 1
+    return sessions, {"applied": applied, "rejected": rejected, "lastSeen": last_seen}
+
+
+def _replay_partition(market, path, start, part, parts, base):
+    sessions = {session_id: GameSession.from_bytes(data) for session_id, data in base.items()}
+    sessions, stats = replay(read_records(path, start, (part, parts)), market, sessions)
+    return {session_id: session.to_bytes() for session_id, session in sessions.items()}, stats
+
+
+def replay_log(path, market, sessions=None, start=0, workers=1):
+    """回放日志文件，返回值同 replay()
+
+    会话之间互不影响：workers > 1 时按会话 ID 分区，每个 worker 只回放自己分区的会话，
+    行情通过共享内存传给 worker (和批量回测共用 simulation.market_pool)。
+    """
+    if workers <= 1:
+        return replay(read_records(path, start), market, sessions)
+    bases = [{} for _ in range(workers)]
+    for session_id, session in (sessions or {}).items():
+        bases[_partition(session_id.encode(), workers)][session_id] = session.to_bytes()
+    with market_pool(market, workers) as pool:
+        futures = [pool.submit(in_worker, _replay_partition, path, start, part, workers, bases[part])
+                   for part in range(workers)]
+        results = [f.result() for f in futures]
+    merged = {}
+    stats = {"applied": 0, "rejected": 0, "lastSeen": {}}
+    for data, part_stats in results:
+        merged.update((session_id, GameSession.from_bytes(b)) for session_id, b in data.items())
+        stats["applied"] += part_stats["applied"]
+        stats["rejected"] += part_stats["rejected"]
+        stats["lastSeen"].update(part_stats["lastSeen"])
+    return merged, stats
+
+
+class ActionLog:
+    """追加式操作日志 + 会话快照 (一个目录只能由一个进程写入)
+
+    append()/snapshot() 只把数据放进内存队列就返回，不阻塞请求；后台线程把队列里攒下的记录
+    一次写入并 fsync，两次 fsync 之间至少间隔 flush_interval 秒 (group commit)。
+    进程异常退出时最多丢失最后 flush_interval 秒的记录；需要确认落盘时调用 flush()。
+    写入失败时整批留在队首，每隔 retry_interval 秒重试，落盘进度不前进；失败期间 wait()/flush() 抛出这个错误。
+    """
+
+    def __init__(self, directory="action_log", flush_interval=0.05, snapshot_every=100, fsync=True, retry_interval=1.0):
+        self.directory = directory
+        self.path = os.path.join(directory, LOG_NAME)
+        self.snapshot_dir = os.path.join(directory, SNAPSHOT_DIR)
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.retry_interval = retry_interval
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._size = os.path.getsize(self.path)
+        self._pending = []  # 待写入的日志行 (bytes) 或快照 (会话 ID, 会话数据)
+        self._cond = threading.Condition()
+        self._appended = 0  # 已提交的记录数
+        self._durable = 0  # 已落盘的记录数
+        self._idle = False
+        self._urgent = False
+        self._closed = False
+        self.batches = 0  # 已完成的写入批次 (fsync 次数)
+        self.error = None  # 最近一次写入失败的异常，成功写入后清空
+        self.failures = 0  # 写入失败的次数
+        self.layout = None  # 行情布局指纹 (recover() 时设置)，写进快照，读取时跳过别的行情的快照
+        self._thread = threading.Thread(target=self._run, name="action-log", daemon=True)
+        self._thread.start()
+
+    def append(self, session_id, version, kind, payload=None):
+        """记录一次操作 (会话修改后的版本号)，返回序号，可传给 wait()"""
+        line = format_record(session_id, version, kind, payload)
+        with self._cond:
+            if self._closed:
+                raise ValueError("Action log is closed.")
+            self._pending.append(line)
+            self._appended += 1
+            if self._idle:
+                self._cond.notify_all()
+            return self._appended
+
+    def snapshot(self, session_id, session):
+        """在日志的当前位置记一份会话快照 (调用方持有会话锁，保证快照和之前的记录一致)"""
+        data = session.to_bytes(self.layout or 0)
+        with self._cond:
+            if not self._closed:
+                self._pending.append((session_id, data))
+
+    def should_snapshot(self, version):
+        return bool(self.snapshot_every) and version % self.snapshot_every == 0
+
+    def wait(self, ticket, timeout=None):
+        """等到序号 ticket 之前的记录都已落盘 (提前开始下一批写入，不等 flush_interval)
+
+        开始等待之后的一次写入失败时抛出 OSError，不会一直等下去。
+        """
+        with self._cond:
+            if self._durable < ticket:
+                self._urgent = True
+                self._cond.notify_all()
+            failures = self.failures
+            done = self._cond.wait_for(lambda: self._durable >= ticket or self.failures != failures, timeout)
+            if self._durable < ticket and self.failures != failures:
+                raise OSError(f"Action log write failed: {self.error}") from self.error
+            return done
+
+    def flush(self, timeout=None):
+        with self._cond:
+            ticket = self._appended
+        return self.wait(ticket, timeout)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._file.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._idle = True
+                    self._cond.wait()
+                    self._idle = False
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                target = self._appended
+                self._urgent = False
+            written = self._write(batch)
+            with self._cond:
+                if written:
+                    self._durable = target
+                    self.error = None
+                    self._cond.notify_all()
+                    # 这段时间里到达的操作攒成下一批，繁忙时每秒最多 1 / flush_interval 次 fsync
+                    self._cond.wait_for(lambda: self._urgent or self._closed, self.flush_interval)
+                    continue
+                # 写入失败：整批放回队首 (之后到达的记录排在后面，顺序不变)，通知等待者后隔一段时间重试
+                self._pending[:0] = batch
+                self._cond.notify_all()
+                if self._closed:
+                    lost = sum(isinstance(item, bytes) for item in self._pending)
+                    print(f"Action log closed with {lost} unwritten records.")
+                    return
+                self._cond.wait_for(lambda: self._closed, self.retry_interval)
+
+    def _write(self, batch):
+        lines = []
+        snapshots = []
+        offset = self._size
+        for item in batch:
+            if isinstance(item, bytes):
+                lines.append(item)
+                offset += len(item)
+            else:
+                snapshots.append((item[0], offset, item[1]))
+        try:
+            self._file.write(b"".join(lines))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except (OSError, ValueError) as e:
+            print(f"Action log write failed: {e}")
+            self.error = e
+            self.failures += 1
+            self._rollback()
+            return False
+        self._size = offset
+        self.batches += 1
+        # 快照在它之前的记录落盘之后才写，快照里的偏移一定指向已经存在的日志位置；
+        # 快照写失败不影响日志，恢复时从更早的快照多回放一些记录
+        for session_id, offset, data in snapshots:
+            try:
+                self._write_snapshot(session_id, offset, data)
+            except OSError as e:
+                print(f"Action log snapshot of {session_id} failed: {e}")
+        return True
+
+    def _rollback(self):
+        """丢掉写了一半的批次：截断到上次成功写入的位置并重新打开文件 (缓冲区里残留的数据一起丢弃)"""
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        try:
+            os.truncate(self.path, self._size)
+            self._file = open(self.path, "ab")
+        except OSError as e:
+            print(f"Action log could not be reopened: {e}")
+
+    def _snapshot_path(self, session_id):
+        return os.path.join(self.snapshot_dir, f"{session_id}.snap")
+
+    def _write_snapshot(self, session_id, offset, data):
+        path = self._snapshot_path(session_id)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_SNAPSHOT_HEADER.pack(offset))
+            f.write(data)
+        os.replace(tmp, path)
+
+    def load_snapshots(self):
+        """{会话 ID: (日志偏移, GameSession, 快照时间)}"""
+        snapshots = {}
+        for name in os.listdir(self.snapshot_dir):
+            if not name.endswith(".snap"):
+                continue
+            path = os.path.join(self.snapshot_dir, name)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                (offset,) = _SNAPSHOT_HEADER.unpack_from(data)
+                session = GameSession.from_bytes(data[_SNAPSHOT_HEADER.size:], self.layout)
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Skipping unreadable snapshot {name}: {e}")
+                continue
+            snapshots[name[:-len(".snap")]] = (offset, session, os.path.getmtime(path))
+        return snapshots
+
+    def recover(self, market, max_age=None, workers=1):
+        """从快照和日志尾部恢复所有会话，返回 ({会话 ID: GameSession}, 统计)
+
+        日志从所有快照里最早的偏移开始读，每个会话只回放自己快照之后的记录。
+        超过 max_age 秒没有任何操作的会话视为已过期：不恢复，并删除它的快照，下次恢复可以从更后面开始读。
+        """
+        self.layout = market_layout(market)
+        self.flush()
+        snapshots = self.load_snapshots()
+        sessions = {session_id: session for session_id, (_, session, _) in snapshots.items()}
+        start = min((offset for offset, _, _ in snapshots.values()), default=0)
+        started = time.perf_counter()
+        sessions, stats = replay_log(self.path, market, sessions, start, workers)
+        stats["elapsedSeconds"] = time.perf_counter() - started
+        if max_age is not None:
+            cutoff = time.time() - max_age
+            for session_id in list(sessions):
+                last_seen = stats["lastSeen"].get(session_id)
+                if last_seen is None and session_id in snapshots:
+                    last_seen = snapshots[session_id][2]
+                if last_seen < cutoff:
+                    del sessions[session_id]
+                    if session_id in snapshots:
+                        os.remove(self._snapshot_path(session_id))
+        return sessions, stats
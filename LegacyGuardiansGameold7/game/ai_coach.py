@@ -0,0 +1,117 @@
+# game/ai_coach.py
+import asyncio
+import queue
+import time
+from game import metrics
+from game.async_loop import BackgroundLoop
+
+UNAVAILABLE_MESSAGE = "Sorry, the AI chat feature is currently unavailable because the API key is not configured."
+ERROR_MESSAGE = "Sorry, my brain seems to have short-circuited. I can't answer right now. Please try again later."
+BUSY_MESSAGE = "Sorry, I'm answering a lot of questions right now. Please try again in a moment."
+
+_DONE = object()
+_FAILED = object()
+
+
+class CoachService:
+    """AI 教练服务
+
+    所有请求共用一个 AsyncOpenAI 客户端 (连接复用)，在后台事件循环中执行；
+    每个请求有总超时，全局信号量限制同时在途的补全请求数量。
+    base_url 可以指向本地的假补全服务 (见 tools/fake_completion_server.py) 做测试。
+    """
+
+    def __init__(self, api_key=None, base_url=None, model="gpt-4o-mini", timeout=20.0, max_in_flight=16,
+                 max_tokens=300, temperature=0.7):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.in_flight = 0
+        self._runtime = BackgroundLoop("ai-coach")
+        self._client = None
+        if self.available:
+            # 导入 openai 要 0.6 秒以上：在构造时 (GameManager 预热线程里) 完成，
+            # 不占用第一个请求的超时时间，也不阻塞事件循环上的其他协程
+            import openai
+            self._client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                              timeout=self.timeout, max_retries=0)
+        # Python 3.10 起信号量在第一次使用时才绑定事件循环，可以在这里创建
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    @property
+    def available(self):
+        return bool(self.api_key)
+
+    async def _stream_completion(self, messages, emit, progress):
+        client = self._client
+        queued = time.perf_counter()
+        async with self._semaphore:
+            started = time.perf_counter()
+            metrics.observe_stage("coach_queue", started - queued)
+            progress["started"] = True
+            self.in_flight += 1
+            try:
+                stream = await client.chat.completions.create(
+                    model=self.model, messages=messages, max_tokens=self.max_tokens,
+                    temperature=self.temperature, stream=True)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not progress["emitted"]:
+                            metrics.observe_stage("coach_first_token", time.perf_counter() - started)
+                        progress["emitted"] = True
+                        emit(chunk.choices[0].delta.content)
+            finally:
+                self.in_flight -= 1
+                metrics.observe_stage("coach_completion", time.perf_counter() - started)
+
+    async def _run(self, messages, emit):
+        progress = {"started": False, "emitted": False}
+        try:
+            await asyncio.wait_for(self._stream_completion(messages, emit, progress), self.timeout)
+        except asyncio.TimeoutError:
+            print(f"OpenAI API call timed out after {self.timeout}s")
+            if not progress["emitted"]:
+                emit(ERROR_MESSAGE if progress["started"] else BUSY_MESSAGE)
+            emit(_FAILED)
+        except Exception as e:
+            print(f"OpenAI API call failed: {e}")
+            if not progress["emitted"]:
+                emit(ERROR_MESSAGE)
+            emit(_FAILED)
+        else:
+            emit(_DONE)
+
+    def stream(self, messages, on_complete=None):
+        """同步生成器：逐段产出回答文本，供 Flask 流式响应使用
+
+        on_complete(answer) 只在补全正常结束时调用 (超时、出错时不调用)，可用于缓存回答。
+        """
+        if not self.available:
+            yield UNAVAILABLE_MESSAGE
+            return
+        chunks = queue.Queue()
+        parts = []
+        future = self._runtime.submit(self._run(messages, chunks.put))
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is _DONE:
+                    if on_complete is not None:
+                        on_complete("".join(parts))
+                    break
+                if chunk is _FAILED:
+                    break
+                parts.append(chunk)
+                yield chunk
+        finally:
+            # 浏览器中途断开时取消还在进行的补全
+            if not future.done():
+                future.cancel()
+
+    def complete(self, messages):
+        """阻塞直到拿到完整回答"""
+        return "".join(self.stream(messages))
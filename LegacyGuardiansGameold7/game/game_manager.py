@@ -1,95 +1,273 @@
 # game/game_manager.py
-import pandas as pd
-from game import level_one_banking, level_two_stock, level_three_portfolio
+from game import metrics, level_one_banking, level_two_stock, level_three_portfolio, simulation
+from game.ai_coach import CoachService
+from game.leaderboard import Leaderboard, player_name, session_score
+from game.market_cache import load_market
+from game.market_data import AssetCatalog
+from game.missions import index_missions_by_day
+from game.session import GameSession, market_layout
+from game.session_store import InMemorySessionStore
+from game.ttl_cache import TTLCache
 
 class GameManager:
-    def __init__(self, data_path='data/'):
-        self.sessions = {}
+    def __init__(self, data_path='data/', session_store=None, coach=None, chat_cache=None, action_log=None):
+        # 会话存储可替换：默认进程内 LRU/TTL，也可以传入 SQLiteSessionStore 跨进程共享
+        self.sessions = session_store if session_store is not None else InMemorySessionStore()
+        self.coach = coach if coach is not None else CoachService()
+        # 相同局面下的相同问题直接复用之前的回答
+        self.chat_cache = chat_cache if chat_cache is not None else TTLCache(maxsize=2048, ttl=600)
+        # 第三关初始建议只取决于 (天数, 持仓)，状态没变的重复轮询直接复用
+        self.advice_cache = TTLCache(maxsize=4096, ttl=None)
+        # 会话状态变化时的回调 (参数是会话 ID)，例如推送服务
+        self.listeners = []
+        # 排行榜在每次提交会话时增量更新，会话被存储淘汰或过期时移出排行榜。
+        # 内存存储的 ttl 从最后一次访问算起 (只轮询的会话仍然有效)，排行榜自己不再按更新时间过期；
+        # SQLite 的 ttl 从最后一次写入算起，排行榜按同样的 ttl 过期，兜住其他 worker 删除的会话。
+        # 排行榜是每个进程各自的：多个 worker 共享 SQLite 时，只有本进程处理过的提交会更新分数
+        # (启动时会从数据库重建一次)，同一班级要看到一致的排名需要单进程运行
+        self.leaderboard = Leaderboard(ttl=None if isinstance(self.sessions, InMemorySessionStore)
+                                       else getattr(self.sessions, "ttl", None))
+        self.sessions.on_evict = self.leaderboard.remove
+        # 可选的操作日志 (game.action_log.ActionLog)：每次提交都追加一条记录，重启时从快照和日志恢复会话
+        self.action_log = action_log
         try:
-            self.assets_df = pd.read_csv(f"{data_path}mock_assets.csv")
-            self.prices_df = pd.read_csv(f"{data_path}mock_market_prices.csv")
-            self.missions_df = pd.read_csv(f"{data_path}missions_catalog.csv")
+            # 价格编译成二进制缓存并只读内存映射 (已叠加任务 shock)，多个 worker 共享同一份物理内存；
+            # 关卡逻辑只通过 MarketData 读取
+            self.assets_df, self.missions_df, self.market = load_market(data_path)
+            # 资产名称和板块只在加载时从 DataFrame 读取一次
+            self.assets = AssetCatalog(self.assets_df, self.market)
+            # 任务目录按天建立索引，避免每次请求扫描整张表
+            self.missions_by_day = index_missions_by_day(self.missions_df)
+            # 持久化的会话按行情布局指纹读取，换了行情之后旧会话视为不存在
+            self.sessions.layout = market_layout(self.market)
             print("Game data loaded successfully.")
         except FileNotFoundError:
             print(f"Error: Could not find data files in the '{data_path}' path.")
-            self.assets_df = self.prices_df = self.missions_df = None
+            self.assets_df = self.missions_df = None
+            self.assets = None
+            self.market = None
+            self.missions_by_day = {}
+        if self.action_log is not None and self.market is not None:
+            self._restore_sessions()
+        self._rebuild_leaderboard()
+
+    def _restore_sessions(self):
+        """从操作日志恢复会话；存储里已有更新版本的会话 (例如 SQLite) 保持不变"""
+        sessions, stats = self.action_log.recover(self.market, max_age=getattr(self.sessions, "ttl", None))
+        for session_id, session_data in sessions.items():
+            with self.sessions.lock(session_id):
+                current = self.sessions.get(session_id)
+                if current is None or current.version < session_data.version:
+                    self.sessions.put(session_id, session_data)
+        print(f"Restored {len(sessions)} sessions from the action log "
+              f"({stats['applied']} records replayed in {stats['elapsedSeconds']:.2f} s).")
+
+    def _rebuild_leaderboard(self):
+        """持久化的会话存储 (SQLite) 重启后已有会话，启动时把它们放进排行榜"""
+        for session_id in self.sessions.session_ids():
+            try:
+                session_data = self.sessions.get(session_id)
+                if session_data is not None:
+                    self._update_leaderboard(session_id, session_data)
+            except (ValueError, IndexError) as e:
+                # 和当前行情对不上的会话不影响启动，玩家下次访问时重新开始
+                print(f"Skipping session {session_id} on the leaderboard: {e}")
 
     def start_new_session(self, session_id):
         """开始或重置一个游戏会话"""
-        self.sessions[session_id] = {
-            "current_level": 1,
-            # Level 1 data
-            "principal": 10000.0,
-            "interest_earned": 0.0,
-            "day": 0, # 在第一关，天数表示存款时长
-            # Level 2 & 3 data
-            "cash": 10000.0,
-            "holdings": {}
-        }
-        return self.sessions[session_id]
+        session_data = GameSession(len(self.market.tickers) if self.market is not None else 0)
+        with self.sessions.lock(session_id):
+            # 重置时版本号继续递增，保证旧的 ETag 不会误判为未变化
+            previous = self.sessions.get(session_id)
+            if previous is not None:
+                session_data.version = previous.version + 1
+            self.sessions.put(session_id, session_data)
+            self._update_leaderboard(session_id, session_data)
+            self._log(session_id, session_data, "reset")
+        if previous is not None:
+            self._notify(session_id)
+        return session_data
 
     def get_session(self, session_id):
         """获取一个会话，如果不存在则创建"""
-        if session_id not in self.sessions:
+        session_data = self.sessions.get(session_id)
+        if session_data is None:
             return self.start_new_session(session_id)
-        return self.sessions[session_id]
+        return session_data
+
+    def get_game_state(self, session_id, since_day=None, since_level=None):
+        """根据当前关卡获取对应的游戏状态
+
+        客户端传入上次拿到的天数和关卡 (since_day/since_level) 且仍在同一关时，
+        只返回新增的历史数据点 ("delta": True)，响应大小不随游戏时长增长。
+        """
+        with self.sessions.lock(session_id, write=False):
+            with metrics.stage("session"):
+                session_data = self.get_session(session_id)
+            return self._get_game_state(session_data, since_day, since_level)
 
-    def get_game_state(self, session_id):
-        """根据当前关卡获取对应的游戏状态"""
-        session_data = self.get_session(session_id)
-        level = session_data.get("current_level", 1)
+    def get_state_version(self, session_id):
+        """当前状态版本号，用于生成 ETag"""
+        with self.sessions.lock(session_id, write=False):
+            session_data = self.get_session(session_id)
+            return session_data.version, session_data.level
 
-        state = {"currentLevel": level}
+    def _get_game_state(self, session_data, since_day=None, since_level=None):
+        level = session_data.level
+        if since_level != level or since_day is None or not 0 <= since_day <= session_data.day:
+            since_day = None
+
+        state = {"currentLevel": level, "version": session_data.version, "delta": since_day is not None}
 
         if level == 1:
             state.update(level_one_banking.get_level_state(session_data))
         elif level == 2:
-            state.update(level_two_stock.get_level_state(session_data, self.prices_df, self.assets_df))
+            state.update(level_two_stock.get_level_state(session_data, self.market, self.assets, since_day))
         elif level == 3:
-            state.update(level_three_portfolio.get_level_state(session_data, self.prices_df, self.assets_df, self.missions_df))
+            state.update(level_three_portfolio.get_level_state(session_data, self.market, self.assets, self.missions_by_day, self.advice_cache, since_day))
 
         return state
 
     def handle_action(self, session_id, action_data):
         """根据当前关卡处理玩家操作"""
-        session_data = self.get_session(session_id)
-        level = session_data.get("current_level", 1)
+        with self.sessions.lock(session_id):
+            session_data = self.get_session(session_id)
+            with metrics.stage("action"):
+                result = self._handle_action(session_data, action_data)
+            if result.get("success"):
+                self._commit(session_id, session_data, "action", action_data)
+            return result
+
+    def _commit(self, session_id, session_data, kind, payload=None):
+        """保存修改后的会话：版本号加一、写操作日志并通知监听者 (调用方持有会话锁)
+
+        kind/payload 是这次修改对应的操作，回放时由 simulation.apply_event 重新执行。
+        """
+        session_data.version += 1
+        self.sessions.put(session_id, session_data)
+        self._update_leaderboard(session_id, session_data)
+        self._log(session_id, session_data, kind, payload)
+        self._notify(session_id)
+
+    def _log(self, session_id, session_data, kind, payload=None):
+        log = self.action_log
+        if log is None:
+            return
+        with metrics.stage("action_log"):
+            log.append(session_id, session_data.version, kind, payload)
+            # 新会话和每隔 snapshot_every 个版本记一份快照，恢复时只回放之后的记录
+            if kind == "reset" or log.should_snapshot(session_data.version):
+                log.snapshot(session_id, session_data)
+
+    def _update_leaderboard(self, session_id, session_data):
+        with metrics.stage("leaderboard"):
+            self.leaderboard.update(session_id, session_score(session_data, self.market), session_data.level)
+
+    def _notify(self, session_id):
+        for listener in self.listeners:
+            try:
+                listener(session_id)
+            except Exception as e:
+                print(f"Session listener failed: {e}")
+
+    def _handle_action(self, session_data, action_data):
+        level = session_data.level
 
         if level == 1:
             return level_one_banking.handle_action(session_data, action_data)
         elif level == 2:
-            return level_two_stock.handle_action(session_data, action_data, self.prices_df)
+            return level_two_stock.handle_action(session_data, action_data, self.market)
         elif level == 3:
-            return level_three_portfolio.handle_action(session_data, action_data, self.prices_df)
+            return level_three_portfolio.handle_action(session_data, action_data, self.market)
 
         return {"success": False, "message": "Invalid level"}
 
+    def handle_batch(self, session_id, orders):
+        """批量处理买卖指令，只在第二、三关可用"""
+        with self.sessions.lock(session_id):
+            session_data = self.get_session(session_id)
+            if session_data.level == 2:
+                result = level_two_stock.handle_batch(session_data, orders, self.market)
+            elif session_data.level == 3:
+                result = level_three_portfolio.handle_batch(session_data, orders, self.market)
+            else:
+                result = {"success": False, "message": "Batch orders are only available in Level 2 and 3."}
+            if result.get("success"):
+                self._commit(session_id, session_data, "batch", orders)
+            return result
+
+    def advance_all(self):
+        """老师操作：所有处于第二、三关的玩家前进一天，返回实际前进的人数"""
+        advanced = 0
+        for session_id in self.sessions.session_ids():
+            with self.sessions.lock(session_id):
+                session_data = self.sessions.get(session_id)
+                if session_data is None or session_data.level < 2:
+                    continue
+                day = session_data.day
+                action = {"action": "next_day"}
+                self._handle_action(session_data, action)
+                if session_data.day != day:
+                    self._commit(session_id, session_data, "action", action)
+                    advanced += 1
+        return advanced
+
     def advance_level(self, session_id):
         """晋级到下一关"""
-        session_data = self.get_session(session_id)
-        current_level = session_data.get("current_level", 1)
+        with self.sessions.lock(session_id):
+            session_data = self.get_session(session_id)
+            result = self._advance_level(session_data)
+            if result.get("success"):
+                self._commit(session_id, session_data, "advance")
+            return result
+
+    def _advance_level(self, session_data):
+        return simulation.advance_level(session_data, self.market)
 
-        if current_level < 3:
-            session_data["current_level"] += 1
-            # 初始化下一关的数据
-            if session_data["current_level"] == 2:
-                # 第二关开始时，重置天数和资产
-                session_data['day'] = 0
-                session_data['cash'] = session_data.pop('principal', 10000) # 继承第一关的本金
-                session_data['holdings'] = {}
-            elif session_data["current_level"] == 3:
-                # 第三关开始时，继承第二关的资产
-                session_data['day'] = session_data.get('day', 0)
+    def get_projection(self, session_id, horizon_days):
+        """第一关的存款推演：从当前本金出发，最快达到目标的存款组合和每种利率的本金曲线"""
+        with self.sessions.lock(session_id, write=False):
+            session_data = self.get_session(session_id)
+            if session_data.level != 1:
+                return {"success": False, "message": "Deposit projections are only available in Level 1."}
+            principal, day = session_data.principal, session_data.day
+        projection = level_one_banking.project(principal, horizon_days, start_day=day)
+        return {"success": True, **projection}
 
-            return {"success": True, "newLevel": session_data["current_level"]}
+    def get_leaderboard(self, session_id, limit=10, offset=0):
+        """排行榜前 limit 名 (从第 offset+1 名开始) 和当前玩家自己的名次；玩家用匿名名字显示"""
+        def public(entry):
+            entry = dict(entry)
+            entry["player"] = player_name(entry.pop("sessionId"))
+            return entry
 
-        return {"success": False, "message": "You are already at the highest level!"}
+        entries = [{**public(entry), "isYou": entry["sessionId"] == session_id}
+                   for entry in self.leaderboard.top(limit, offset)]
+        you = self.leaderboard.rank(session_id)
+        return {"players": len(self.leaderboard), "entries": entries, "you": public(you) if you is not None else None}
 
     def handle_chat(self, session_id, user_message):
         """处理聊天请求，只在第三关可用"""
-        session_data = self.get_session(session_id)
-        if session_data.get("current_level") >= 3:
-            answer = level_three_portfolio.get_chat_response(session_data, user_message, self.prices_df, self.assets_df, self.missions_df)
-            return {"answer": answer}
-        else:
-            return {"answer": "Chat coach is only available after Level 3."}
\ No newline at end of file
+        return {"answer": "".join(self.stream_chat(session_id, user_message))}
+
+    def stream_chat(self, session_id, user_message):
+        """流式聊天：逐段产出 AI 教练的回答"""
+        with self.sessions.lock(session_id, write=False):
+            session_data = self.get_session(session_id)
+            if session_data.level < 3:
+                messages = None
+            else:
+                # 在锁内把状态整理成提示词，调用模型时不再占用会话锁
+                cache_key = level_three_portfolio.chat_fingerprint(
+                    session_data, user_message, self.market, self.missions_by_day)
+                messages = level_three_portfolio.build_chat_messages(
+                    session_data, user_message, self.market, self.assets, self.missions_by_day)
+        if messages is None:
+            yield "Chat coach is only available after Level 3."
+            return
+        with metrics.stage("chat_cache"):
+            cached = self.chat_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        yield from self.coach.stream(messages, on_complete=lambda answer: self.chat_cache.put(cache_key, answer))
@@ -0,0 +1,164 @@
+# game/leaderboard.py
+# 班级排行榜：会话状态变化时增量更新每个玩家的总资产，排名和前 k 名查询不用重新计算所有会话
+import bisect
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+def session_score(session, market):
+    """排行榜分数 = 总资产：第一关是本金，第二、三关是现金加持仓市值"""
+    if session.level == 1 or market is None:
+        return round(session.principal, 2)
+    return round(session.cash + float(market.row(session.day) @ session.holdings), 2)
+
+
+def player_name(session_id):
+    """排行榜上显示的匿名名字；会话 ID 就是登录凭证，不能直接公开"""
+    return "Player " + hashlib.sha256(session_id.encode()).hexdigest()[:6].upper()
+
+
+class _SortedList:
+    """分桶有序列表：每个桶是一个有序的小 list，另存每个桶的最大值
+
+    插入/删除先在桶最大值上二分找到桶，再在桶内二分，移动的元素不超过一个桶的大小；
+    按位置遍历只需顺序读取桶，求某个元素的位置是桶内下标加上前面各桶长度之和。
+    """
+
+    def __init__(self, load=256):
+        self._load = load
+        self._buckets = []
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        buckets, maxes = self._buckets, self._maxes
+        if not buckets:
+            buckets.append([key])
+            maxes.append(key)
+            self._len = 1
+            return
+        i = bisect.bisect_left(maxes, key)
+        if i == len(maxes):
+            i -= 1
+            buckets[i].append(key)
+            maxes[i] = key
+        else:
+            bisect.insort(buckets[i], key)
+        self._len += 1
+        bucket = buckets[i]
+        if len(bucket) > 2 * self._load:
+            # 桶太大时对半拆开，保持桶内插入的移动量有上限
+            buckets.insert(i + 1, bucket[self._load:])
+            del bucket[self._load:]
+            maxes.insert(i, bucket[-1])
+
+    def remove(self, key):
+        i = bisect.bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        j = bisect.bisect_left(bucket, key)
+        del bucket[j]
+        self._len -= 1
+        if not bucket:
+            del self._buckets[i], self._maxes[i]
+        elif j == len(bucket):
+            self._maxes[i] = bucket[-1]
+
+    def bisect_left(self, key):
+        """小于 key 的元素个数"""
+        i = bisect.bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return self._len
+        return sum(map(len, self._buckets[:i])) + bisect.bisect_left(self._buckets[i], key)
+
+    def islice(self, start, stop):
+        """按位置顺序产出 [start, stop) 范围的元素"""
+        position = 0
+        for bucket in self._buckets:
+            if start >= stop:
+                return
+            if position + len(bucket) > start:
+                chunk = bucket[start - position:stop - position]
+                yield from chunk
+                start += len(chunk)
+            position += len(bucket)
+
+
+class Leaderboard:
+    """按总资产排名的排行榜，线程安全
+
+    有序列表里存 (-分数, 会话 ID)：分数高的在前。更新一个会话是一次删除加一次插入；
+    取前 k 名只读前 k 个元素，查排名是一次二分。同分并列 (1, 2, 2, 4...)。
+    超过 ttl 秒没有更新的会话会被移出排行榜；ttl=None 时只由 remove() 移出 (会话存储的淘汰回调)。
+    """
+
+    def __init__(self, ttl=None, load=256):
+        self.ttl = ttl
+        self._ranking = _SortedList(load)
+        self._entries = OrderedDict()  # session_id -> ((-分数, 会话 ID), 关卡, 最后更新时间)，按更新时间排序
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _expire(self, now):
+        # 最久没更新的在最前面，过期的只会出现在头部
+        while self._entries:
+            session_id, (key, _, updated) = next(iter(self._entries.items()))
+            if now - updated <= self.ttl:
+                break
+            self._entries.popitem(last=False)
+            self._ranking.remove(key)
+
+    def update(self, session_id, score, level):
+        now = time.monotonic()
+        key = (-score, session_id)
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is None:
+                self._ranking.add(key)
+            elif entry[0] != key:
+                self._ranking.remove(entry[0])
+                self._ranking.add(key)
+            self._entries[session_id] = (key, level, now)
+            if self.ttl is not None:
+                self._expire(now)
+
+    def remove(self, session_id):
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._ranking.remove(entry[0])
+
+    def _entry(self, rank, key):
+        return {"rank": rank, "sessionId": key[1], "level": self._entries[key[1]][1], "totalAssets": -key[0]}
+
+    def top(self, k=10, start=0):
+        """第 start+1 到 start+k 名：[{"rank", "sessionId", "level", "totalAssets"}, ...]"""
+        with self._lock:
+            if self.ttl is not None:
+                self._expire(time.monotonic())
+            keys = list(self._ranking.islice(start, start + k))
+            if not keys:
+                return []
+            # 第一名的并列名次要数出前面有多少人分数更高，之后的名次边遍历边推算
+            rank = self._ranking.bisect_left((keys[0][0], "")) + 1
+            entries = []
+            for position, key in enumerate(keys, start + 1):
+                if entries and key[0] != -entries[-1]["totalAssets"]:
+                    rank = position
+                entries.append(self._entry(rank, key))
+            return entries
+
+    def rank(self, session_id):
+        """某个会话的名次和分数，不在排行榜上时返回 None"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            key = entry[0]
+            return self._entry(self._ranking.bisect_left((key[0], "")) + 1, key)
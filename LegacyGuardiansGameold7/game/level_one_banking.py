@@ -1,12 +1,21 @@
 # game/level_one_banking.py
 import math
+import numpy as np
 
 LEVEL_GOAL = 10400  # 目标：本金达到 10500
+AVAILABLE_RATES = [
+    {"period": 10, "rate": 0.015}, # 10天 年化 1.5%
+    {"period": 30, "rate": 0.025}, # 30天 年化 2.5%
+    {"period": 60, "rate": 0.04},  # 60天 年化 4.0%
+]
+# 只能按上表的期限和利率存款；客户端传来的任意期限会让天数溢出会话的序列化字段
+_RATE_BY_PERIOD = {option["period"]: option["rate"] for option in AVAILABLE_RATES}
+MAX_PROJECTION_DAYS = 3650
 
 def get_level_state(session_data):
     """返回第一关前端渲染所需的数据"""
-    principal = session_data.get('principal', 10000)
-    interest_earned = session_data.get('interest_earned', 0)
+    principal = session_data.principal
+    interest_earned = session_data.interest
     is_goal_met = bool(principal >= LEVEL_GOAL)
     
     return {
@@ -14,11 +23,7 @@ def get_level_state(session_data):
         "interestEarned": interest_earned,
         "goal": LEVEL_GOAL,
         "isGoalMet": is_goal_met,
-        "availableRates": [
-            {"period": 10, "rate": 0.015}, # 10天 年化 1.5%
-            {"period": 30, "rate": 0.025}, # 30天 年化 2.5%
-            {"period": 60, "rate": 0.04},  # 60天 年化 4.0%
-        ]
+        "availableRates": AVAILABLE_RATES,
     }
 
 def handle_action(session_data, action_data):
@@ -28,18 +33,85 @@ def handle_action(session_data, action_data):
         try:
             period = int(action_data.get('period'))
             rate = float(action_data.get('rate'))
-            principal = session_data.get('principal', 10000)
+            if not math.isclose(rate, _RATE_BY_PERIOD.get(period, math.nan)):
+                raise ValueError
+            rate = _RATE_BY_PERIOD[period]
+            principal = session_data.principal
 
             # 利息计算公式: 本金 * 年化利率 * (存款天数 / 365)
             interest = principal * rate * (period / 365.0)
             
-            session_data['principal'] += interest
-            session_data['interest_earned'] = session_data.get('interest_earned', 0) + interest
-            session_data['day'] = session_data.get('day', 0) + period # 时间流逝
+            session_data.principal += interest
+            session_data.interest += interest
+            session_data.day += period # 时间流逝
             
 
             return {"success": True, "message": f"Successfully deposited for {period} days and earned ${interest:.2f} in interest!"}
-        except (ValueError, TypeError):
+        except (ValueError, TypeError, OverflowError):
             return {"success": False, "message": "Invalid deposit parameters"}
 
     return {"success": False, "message": "Unknown action"}
+
+def project(principal, horizon_days, rates=AVAILABLE_RATES, goal=LEVEL_GOAL, start_day=0):
+    """假设推演：在 horizon_days 天内所有存款组合里，最快达到 goal 的路径，以及每种利率一直续存的本金曲线
+
+    每次存款把本金乘以 (1 + rate * period / 365)，所以本金只取决于选了哪些期限，与顺序无关。
+    以所有期限的最大公约数为时间单位做动态规划：best[t] = 恰好用完 t 个单位时本金对数的最大值，
+    每个单位只需要比较几种期限，推演几年也只有一两百步；按最高单位收益都达不到目标时直接跳过。
+    """
+    horizon_days = max(0, min(int(horizon_days), MAX_PROJECTION_DAYS))
+    periods = np.array([r["period"] for r in rates], dtype=np.int64)
+    factors = 1 + np.array([r["rate"] for r in rates], dtype=np.float64) * periods / 365.0
+    unit = int(np.gcd.reduce(periods))
+    steps = periods // unit
+    weights = np.log(factors)
+    horizon = horizon_days // unit
+
+    target = math.log(goal / principal) if principal > 0 else math.inf
+    reached = 0 if target <= 0 else None
+    # 剪枝：即使每天都按最高的单位收益复利也达不到目标时，不必做动态规划
+    if reached is None and float((weights / steps).max()) * horizon >= target:
+        best = [0.0] + [-math.inf] * horizon
+        choice = [-1] * (horizon + 1)
+        options = list(zip(steps.tolist(), weights.tolist()))
+        for t in range(1, horizon + 1):
+            for i, (step, weight) in enumerate(options):
+                if step <= t and best[t - step] + weight > best[t]:
+                    best[t] = best[t - step] + weight
+                    choice[t] = i
+            if best[t] >= target - 1e-12:
+                reached = t
+                break
+
+    fastest = None
+    if reached is not None:
+        path = []
+        t = reached
+        while t > 0:
+            path.append(int(choice[t]))
+            t -= int(steps[choice[t]])
+        # 先存长期限，再存短期限；按游戏里的实际顺序逐步计算本金
+        path.sort(key=lambda i: -periods[i])
+        value, day, plan = principal, start_day, []
+        for i in path:
+            value *= factors[i]
+            day += int(periods[i])
+            plan.append({"period": int(periods[i]), "rate": rates[i]["rate"], "day": day, "principal": round(float(value), 2)})
+        fastest = {"days": reached * unit, "reachedDay": start_day + reached * unit,
+                   "finalPrincipal": round(float(value), 2), "deposits": plan}
+
+    # 每种利率一直续存：第 k 次到期后的本金 = 本金 × 因子^k
+    curves = []
+    for period, factor, rate in zip(periods.tolist(), factors, rates):
+        k = np.arange(horizon_days // period + 1)
+        values = principal * factor ** k
+        curves.append({"period": period, "rate": rate["rate"], "points": [
+            {"day": start_day + d, "principal": round(v, 2)} for d, v in zip((k * period).tolist(), values.tolist())]})
+
+    return {
+        "principal": principal,
+        "goal": goal,
+        "horizonDays": horizon_days,
+        "fastestPath": fastest,
+        "curves": curves,
+    }
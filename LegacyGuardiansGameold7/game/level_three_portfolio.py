@@ -1,92 +1,116 @@
 # game/level_three_portfolio.py
-import pandas as pd
-import openai
-
-def get_level_state(session_data, prices_df, assets_df, missions_df):
-    """返回第三关前端渲染所需的数据"""
-    day = session_data.get('day', 0)
-    cash = session_data.get('cash', 10000)
-    holdings = session_data.get('holdings', {})
-    holdings_with_cash = {"_cash": cash, **holdings}
-
-    total_assets = calculate_portfolio_value(holdings_with_cash, day, prices_df)
-    current_prices = prices_df.iloc[day].to_dict()
-    todays_missions = missions_df[missions_df["effect_days"].apply(lambda s: str(day) in str(s))]
-
-    assets_info = [{
-        "ticker": asset['ticker'], "name": asset['name'], "sector": asset['sector'],
-        "price": round(current_prices.get(asset['ticker'], 0), 2),
-        "holding": holdings.get(asset['ticker'], 0)
-    } for _, asset in assets_df.iterrows()]
-
-    return {
+import re
+import numpy as np
+from game import metrics, orders as order_book, portfolio_history
+
+def get_level_state(session_data, market, assets, missions_by_day, advice_cache=None, since_day=None):
+    """返回第三关前端渲染所需的数据
+
+    给出 since_day 时是增量响应：组合历史只包含 since_day 到今天的点 (since_day 当天的值可能因交易而变化)，
+    资产列表换成持仓和价格 (见下)，并省略只在首次渲染时用到的初始建议。
+    """
+    day = session_data.day
+    cash = session_data.cash
+    with metrics.stage("lookup"):
+        holdings = session_data.holdings_dict(market.tickers)
+        holdings_with_cash = {"_cash": cash, **holdings}
+        todays_missions = missions_by_day.get(day, [])
+
+        # 资产目录在加载时已按行情列号对齐，这里只需按列读取当天价格和持仓
+        prices = market.row(day).tolist()
+        if since_day is None:
+            quantities = session_data.holdings.tolist()
+            assets_info = [{
+                "ticker": ticker, "name": name, "sector": sector,
+                "price": round(prices[col], 2) if col is not None else 0,
+                "holding": quantities[col] if col is not None else 0,
+            } for ticker, name, sector, col in zip(assets.tickers, assets.names, assets.sectors, assets.columns)]
+
+    with metrics.stage("valuation"):
+        total_assets = cash + float(market.row(day) @ session_data.holdings)
+
+    # 补齐组合历史和生成图表数据算同一个阶段，每个请求只计一次耗时
+    with metrics.stage("history"):
+        history = portfolio_history.ensure(session_data, market)
+        if since_day is not None:
+            portfolio = [
+                {"date": d, "value": round(v, 2)}
+                for d, v in zip(market.dates[since_day:day + 1].tolist(), history.value_series(since_day, day + 1).tolist())
+            ]
+        else:
+            portfolio = get_history_for_chart(holdings_with_cash, day, market, history)
+    state = {
         "day": day + 1,
-        "date": current_prices.get("date", ""),
+        "date": market.date(day),
         "cash": round(cash, 2),
         "totalAssets": round(total_assets, 2),
-        "assets": assets_info,
-        "missions": todays_missions.to_dict('records'),
-        "portfolioHistory": get_history_for_chart(holdings_with_cash, day, prices_df),
-        "aiCoachInitialTips": get_ai_coach_advice(holdings_with_cash, day, assets_df, prices_df)
+        "portfolioHistory": portfolio,
     }
-
-def handle_action(session_data, action_data, prices_df):
+    if since_day is not None:
+        # 增量响应不重发资产名称和板块：持仓只发非零的 {代码: 数量}，
+        # 换了一天才发按资产目录顺序排列的价格和当天任务，由前端合并进上次的 assets
+        state["holdings"] = holdings
+        if since_day != day:
+            state["prices"] = [round(prices[col], 2) if col is not None else 0 for col in assets.columns]
+            state["missions"] = todays_missions
+        return state
+    state["assets"] = assets_info
+    state["missions"] = todays_missions
+    with metrics.stage("coach_tips"):
+        state["aiCoachInitialTips"] = get_ai_coach_advice(holdings_with_cash, day, market, advice_cache,
+                                                          session_data.holdings)
+    return state
+
+def handle_action(session_data, action_data, market):
     """处理第三关的操作"""
     action = action_data.get('action')
-    day = session_data.get('day', 0)
+    day = session_data.day
 
     if action == 'next_day':
-        if day < len(prices_df) - 1:
-            session_data['day'] += 1
+        if day < len(market) - 1:
+            session_data.day += 1
+            portfolio_history.record(session_data, market)
         return {"success": True}
 
     if action in ('buy', 'sell'):
         ticker = action_data.get("ticker")
-        try: quantity = int(action_data.get("quantity", 1)); assert quantity > 0
+        try: quantity = int(action_data.get("quantity", 1)); assert 0 < quantity <= order_book.MAX_QUANTITY
         except: return {"success": False, "message": "Invalid quantity"}
 
-        price = prices_df.iloc[day].get(ticker)
+        price = market.price(day, ticker) if isinstance(ticker, str) else None
         if price is None: return {"success": False, "message": "Invalid ticker number"}
+        col = market.column_of(ticker)
 
         if action == 'buy':
             cost = price * quantity
-            if session_data["cash"] < cost: return {"success": False, "message": "Insufficient cash"}
-            session_data["cash"] -= cost
-            session_data["holdings"][ticker] = session_data["holdings"].get(ticker, 0) + quantity
+            if session_data.cash < cost: return {"success": False, "message": "Insufficient cash"}
+            session_data.cash -= cost
+            session_data.holdings[col] += quantity
         else: # sell
-            if session_data["holdings"].get(ticker, 0) < quantity: return {"success": False, "message": "Insufficient holdings"}
-            session_data["holdings"][ticker] -= quantity
-            session_data["cash"] += price * quantity
+            if session_data.holdings[col] < quantity: return {"success": False, "message": "Insufficient holdings"}
+            session_data.holdings[col] -= quantity
+            session_data.cash += price * quantity
+        portfolio_history.record(session_data, market)
         return {"success": True}
 
     return {"success": False, "message": "Unknown action"}
 
-def get_chat_response(session_data, user_message, prices_df, assets_df, missions_df):
-    """与ChatGPT交互"""
-    if not openai.api_key:
-        return "抱歉，AI聊天功能当前不可用，因为未配置API密钥。"
-
-    day = session_data['day']
-    holdings_str = ", ".join([f"{t}: {q}股" for t, q in session_data['holdings'].items() if q > 0]) or "无"
-    cash_str = f"${session_data['cash']:.2f}"
-    current_prices = prices_df.iloc[day].to_dict()
-    prices_str = ", ".join([f"{t}: ${current_prices.get(t, 0):.2f}" for t in assets_df['ticker']])
-    missions = missions_df[missions_df["effect_days"].apply(lambda s: str(day) in str(s))]
-    mission_str = "; ".join([f"{m['title']}({m['hint']})" for _, m in missions.iterrows()]) or "无"
-
-    def get_chat_response(session_data, user_message, prices_df, assets_df, missions_df):
-        """与ChatGPT交互"""
-        if not openai.api_key:
-            return "Sorry, the AI chat feature is currently unavailable because the API key is not configured."
-
-    day = session_data['day']
-    # Note: Translated "股" to "shares" and "无" to "None"
-    holdings_str = ", ".join([f"{t}: {q} shares" for t, q in session_data['holdings'].items() if q > 0]) or "None"
-    cash_str = f"${session_data['cash']:.2f}"
-    current_prices = prices_df.iloc[day].to_dict()
-    prices_str = ", ".join([f"{t}: ${current_prices.get(t, 0):.2f}" for t in assets_df['ticker']])
-    missions = missions_df[missions_df["effect_days"].apply(lambda s: str(day) in str(s))]
-    mission_str = "; ".join([f"{m['title']}({m['hint']})" for _, m in missions.iterrows()]) or "None"
+def handle_batch(session_data, orders, market):
+    """批量下单：按当天价格一起校验现金和持仓，全部成交或全部不成交"""
+    delta, error = order_book.parse_orders(orders, market)
+    if error:
+        return {"success": False, "message": error}
+    return order_book.apply_orders(session_data, delta, market)
+
+def build_chat_messages(session_data, user_message, market, assets, missions_by_day):
+    """把当前游戏状态和玩家问题整理成发给 ChatGPT 的消息列表"""
+    day = session_data.day
+    holdings_str = ", ".join([f"{t}: {q} shares" for t, q in session_data.holdings_dict(market.tickers).items() if q > 0]) or "None"
+    cash_str = f"${session_data.cash:.2f}"
+    current_prices = market.price_map(day)
+    prices_str = ", ".join([f"{t}: ${current_prices.get(t, 0):.2f}" for t in assets.tickers])
+    missions = missions_by_day.get(day, [])
+    mission_str = "; ".join([f"{m['title']}({m['hint']})" for m in missions]) or "None"
 
     system_prompt = (
         "You are a patient and skilled investment coach guiding a teenage player in an investment simulation game called 'Legacy Guardian'."
@@ -97,54 +121,74 @@ def get_chat_response(session_data, user_message, prices_df, assets_df, missions
         f"--- Game Status ---\nToday is Day {day + 1}.\nPlayer Cash: {cash_str}\nPlayer Holdings: {holdings_str}\n"
         f"Today's Market Prices: {prices_str}\nToday's Special Events: {mission_str}\n--- Player's Question ---"
     )
-    try:
-        completion = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": context_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            max_tokens=300, temperature=0.7
-        )
-        return completion.choices[0].message.content
-    except Exception as e:
-        print(f"OpenAI API call failed: {e}")
-        return "Sorry, my brain seems to have short-circuited. I can't answer right now. Please try again later."
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": context_prompt},
+        {"role": "user", "content": user_message}
+    ]
+
+def chat_fingerprint(session_data, user_message, market, missions_by_day):
+    """AI 教练回答缓存的键：天数、分桶后的现金/持仓占比、当天任务、规范化后的问题"""
+    day = session_data.day
+    position_values = market.row(day) * session_data.holdings
+    total = session_data.cash + float(position_values.sum())
+    if total <= 0:
+        total = 1.0
+    # 占比按 10% 分桶，组合相近的玩家可以共用同一个回答
+    cash_bucket = int(round(session_data.cash / total * 10))
+    holding_buckets = tuple(int(b) for b in np.rint(position_values / total * 10).tolist())
+    mission_codes = tuple(m['code'] for m in missions_by_day.get(day, []))
+    question = " ".join(re.sub(r"[^\w\s]", " ", str(user_message or "").lower()).split())
+    return (day, cash_bucket, holding_buckets, mission_codes, question)
 
 # --- 通用辅助函数 ---
-def calculate_portfolio_value(holdings, day_idx, prices_df):
-    price_map = prices_df.iloc[day_idx].to_dict()
+def calculate_portfolio_value(holdings, day_idx, market):
+    row = market.row(day_idx)
     pv = holdings.get("_cash", 0.0)
     for ticker, quantity in holdings.items():
         if ticker != "_cash":
-            pv += quantity * price_map.get(ticker, 0)
+            col = market.column_of(ticker)
+            if col is not None:
+                pv += quantity * float(row[col])
     return pv
 
-def get_history_for_chart(holdings, to_day, prices_df):
-    history = []
+def get_history_for_chart(holdings, to_day, market, history=None):
     step = max(1, to_day // 30) if to_day > 0 else 1
-    for i in range(0, to_day + 1, step):
-        value = calculate_portfolio_value(holdings, i, prices_df)
-        history.append({"date": prices_df.iloc[i]["date"], "value": round(value, 2)})
+    dates = market.dates[0:to_day + 1:step].tolist()
+    if history is not None and history.last_day >= to_day:
+        # 使用持仓日志里缓存的每日价值，反映真实的历史持仓
+        values = history.value_series(0, to_day + 1, step).tolist()
+        last_value = float(history.values[to_day])
+    else:
+        holdings_vec = market.holdings_vector(holdings)
+        values = market.portfolio_values(holdings_vec, holdings.get("_cash", 0.0), 0, to_day + 1, step).tolist()
+        last_value = float(market.row(to_day) @ holdings_vec) + holdings.get("_cash", 0.0)
     if to_day > 0 and to_day % step != 0:
-        value = calculate_portfolio_value(holdings, to_day, prices_df)
-        history.append({"date": prices_df.iloc[to_day]["date"], "value": round(value, 2)})
-    return history
-
-def get_ai_coach_advice(holdings, day, assets_df, prices_df):
-    """生成AI教练的初始建议"""
-    price_map = prices_df.iloc[day].to_dict()
-    tickers = [t for t in holdings if t != "_cash"]
-    values, sectors = [], []
-    for t in tickers:
-        val = holdings.get(t, 0) * price_map.get(t, 0.0)
-        values.append(val)
-        sector_info = assets_df[assets_df["ticker"] == t]
-        if not sector_info.empty: sectors.append(sector_info["sector"].values[0])
-
-    total_invested = sum(values)
+        values.append(last_value)
+        dates.append(market.date(to_day))
+    return [{"date": d, "value": round(v, 2)} for d, v in zip(dates, values)]
+
+def get_ai_coach_advice(holdings, day, market, cache=None, holdings_vec=None):
+    """生成AI教练的初始建议 (结果只取决于天数和持仓，可按 (day, 现金, 持仓向量) 缓存)
+
+    已有按列对齐的持仓向量 (例如会话的 holdings) 时传 holdings_vec，省去从 dict 转换。
+    """
     cash = holdings.get("_cash", 0.0)
+    if holdings_vec is None:
+        holdings_vec = market.holdings_vector(holdings)
+    if cache is None:
+        return _coach_tips(holdings_vec, cash, day, market)
+    # 缓存键直接取持仓向量的字节，不用逐个股票排序、组元组
+    key = (day, cash, np.asarray(holdings_vec, dtype=np.int64).tobytes())
+    tips = cache.get(key)
+    if tips is None:
+        tips = _coach_tips(holdings_vec, cash, day, market)
+        cache.put(key, tips)
+    return list(tips)
+
+def _coach_tips(holdings_vec, cash, day, market):
+    values = market.row(day) * holdings_vec
+    total_invested = float(values.sum())
     total = total_invested + cash
     if total == 0: total = 1
 
@@ -154,12 +198,11 @@ def get_ai_coach_advice(holdings, day, assets_df, prices_df):
     if cash / total > 0.5:
         tips.append("Your cash ratio is quite high. Consider buying in batches to try and secure profits.")
     if total_invested > 0:
-        by_sector = {s: 0 for s in assets_df['sector'].unique()}
-        for v, s in zip(values, sectors):
-            by_sector[s] += v
-        if by_sector and max(by_sector.values()) / total_invested > 0.6:
+        # 一次矩阵乘法得到各板块市值
+        by_sector = market.sector_matrix @ values
+        if by_sector.size and by_sector.max() / total_invested > 0.6:
             tips.append("Your portfolio is too concentrated in a single sector. It's advisable to diversify your investments.")
     if not tips:
         tips.append("Your strategy looks solid. Feel free to ask me for specific advice about today's market or your holdings.")
 
-    return tips
\ No newline at end of file
+    return tips
@@ -1,20 +1,19 @@
 # game/level_two_stock.py
-import pandas as pd
+from game import metrics, orders as order_book, portfolio_history
 
 LEVEL_GOAL = 10800 # 目标：总资产达到 11000
 STOCK_TICKER = "TECH_A" # 本关只允许交易这支股票
 
 # In game/level_two_stock.py
 
-def get_level_state(session_data, prices_df, assets_df):
-    """返回第二关前端渲染所需的数据"""
-    day = session_data.get('day', 0)
-    cash = session_data.get('cash', 10000)
-    holdings = session_data.get('holdings', {})
+def get_level_state(session_data, market, assets, since_day=None):
+    """返回第二关前端渲染所需的数据 (给出 since_day 时价格历史只包含之后的天数)"""
+    day = session_data.day
+    cash = session_data.cash
     
-    stock_info = assets_df[assets_df['ticker'] == STOCK_TICKER].iloc[0]
-    current_price = prices_df.iloc[day][STOCK_TICKER]
-    stock_holding = holdings.get(STOCK_TICKER, 0)
+    with metrics.stage("lookup"):
+        current_price = market.price(day, STOCK_TICKER)
+        stock_holding = int(session_data.holdings[market.column_of(STOCK_TICKER)])
     
     total_value = cash + stock_holding * current_price
     
@@ -22,18 +21,19 @@ def get_level_state(session_data, prices_df, assets_df):
     # Convert the result to a standard Python bool
     is_goal_met = bool(total_value >= LEVEL_GOAL)
 
-    price_history = []
-    for i in range(day + 1):
-        price_history.append({
-            "date": prices_df.iloc[i]['date'],
-            "price": prices_df.iloc[i][STOCK_TICKER]
-        })
+    # 直接切片价格列，不再逐行 iloc；历史价格不会变，增量只需要 since_day 之后的点
+    start = 0 if since_day is None else since_day + 1
+    with metrics.stage("history"):
+        price_history = [
+            {"date": d, "price": p}
+            for d, p in zip(market.dates[start:day + 1].tolist(), market.column(STOCK_TICKER, start, day + 1).tolist())
+        ]
 
     return {
         "cash": cash,
         "stock": {
             "ticker": STOCK_TICKER,
-            "name": stock_info['name'],
+            "name": assets.name(STOCK_TICKER),
             "price": current_price,
             "holding": stock_holding
         },
@@ -42,49 +42,63 @@ def get_level_state(session_data, prices_df, assets_df):
         "isGoalMet": is_goal_met, # Now this is a safe type
         "priceHistory": price_history,
         "day": day,
-        "date": prices_df.iloc[day]['date']
+        "date": market.date(day)
     }
 
 # 在 game/level_two_stock.py 文件中
 
-def handle_action(session_data, action_data, prices_df):
+def handle_action(session_data, action_data, market):
     """处理第二关的操作：买卖股票 或 等待一天"""
     action = action_data.get('action')
 
     # --- 新增的逻辑 ---
     if action == 'next_day':
-        day = session_data.get('day', 0)
-        if day < len(prices_df) - 1:
-            session_data['day'] += 1
+        if session_data.day < len(market) - 1:
+            session_data.day += 1
+            portfolio_history.record(session_data, market)
         return {"success": True, "message": "Proceeded to the next day."}
     # --- 新增结束 ---
 
     try:
         quantity = int(action_data.get('quantity'))
-        if quantity <= 0: raise ValueError
-    except (ValueError, TypeError):
+        if not 0 < quantity <= order_book.MAX_QUANTITY: raise ValueError
+    except (ValueError, TypeError, OverflowError):
         return {"success": False, "message": "must provide a valid positive integer quantity"}
 
-    day = session_data.get('day', 0)
-    price = prices_df.iloc[day][STOCK_TICKER]
+    price = market.price(session_data.day, STOCK_TICKER)
+    col = market.column_of(STOCK_TICKER)
 
     if action == 'buy':
         cost = price * quantity
-        if session_data['cash'] < cost:
+        if session_data.cash < cost:
             return {"success": False, "message": "Insufficient cash"}
             
-        session_data['cash'] -= cost
-        session_data['holdings'][STOCK_TICKER] = session_data['holdings'].get(STOCK_TICKER, 0) + quantity
+        session_data.cash -= cost
+        session_data.holdings[col] += quantity
     elif action == 'sell':
-        if session_data['holdings'].get(STOCK_TICKER, 0) < quantity:
+        if session_data.holdings[col] < quantity:
             return {"success": False, "message": "Insufficient holdings"}
-        session_data['holdings'][STOCK_TICKER] -= quantity
-        session_data['cash'] += price * quantity
+        session_data.holdings[col] -= quantity
+        session_data.cash += price * quantity
     else:
         return {"success": False, "message": "Unknown action"}
 
+    portfolio_history.record(session_data, market)
+
     # 买卖后也自动进入下一天
-    if session_data['day'] < len(prices_df) - 1:
-        session_data['day'] += 1
-        
-    return {"success": True, "message": f"Your operation was successful!"}
\ No newline at end of file
+    if session_data.day < len(market) - 1:
+        session_data.day += 1
+        portfolio_history.record(session_data, market)
+
+    return {"success": True, "message": f"Your operation was successful!"}
+
+def handle_batch(session_data, orders, market):
+    """批量处理 TECH_A 的买卖指令 (全部成交或全部不成交)，成交后和单笔操作一样进入下一天"""
+    delta, error = order_book.parse_orders(orders, market, allowed_tickers={STOCK_TICKER}, default_ticker=STOCK_TICKER)
+    if error:
+        return {"success": False, "message": error}
+    result = order_book.apply_orders(session_data, delta, market)
+    if result["success"] and session_data.day < len(market) - 1:
+        session_data.day += 1
+        portfolio_history.record(session_data, market)
+    return result
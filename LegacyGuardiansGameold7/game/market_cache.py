@@ -0,0 +1,147 @@
+# game/market_cache.py
+# 行情二进制缓存：第一次启动时把 CSV 编译成 .npy (需要时连同叠加任务冲击后的矩阵)，
+# 之后各个 worker 只读内存映射，共享同一份物理内存
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from game.market_data import MarketData, load_market_data
+from game.market_events import apply_mission_shocks, shocks_pending
+
+CACHE_VERSION = 1
+CACHE_DIR = ".cache"
+SOURCES = ("mock_market_prices.csv", "mock_assets.csv", "missions_catalog.csv")
+# 数据目录里直接放的是二进制价格时，缓存里只有叠加任务冲击后的矩阵，原始价格直接映射源文件
+BINARY_SOURCES = ("mock_market_prices.npy", "mock_market_prices.json", "missions_catalog.csv")
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get("version") == CACHE_VERSION else None
+
+
+def _is_fresh(manifest, data_path, shocks, source_names):
+    """源文件大小和修改时间都没变就直接用缓存；变了再比较内容哈希 (只是 touch 过的文件不必重建)"""
+    if manifest is None or manifest.get("mission_shocks") != shocks:
+        return False, False
+    touched = False
+    if set(manifest["sources"]) != set(source_names):
+        return False, False
+    for name in source_names:
+        recorded = manifest["sources"].get(name)
+        path = os.path.join(data_path, name)
+        if recorded is None or not os.path.exists(path):
+            return False, False
+        stamp = _stamp(path)
+        if stamp["size"] == recorded["size"] and stamp["mtime_ns"] == recorded["mtime_ns"]:
+            continue
+        if stamp["size"] != recorded["size"] or _file_hash(path) != recorded["sha256"]:
+            return False, False
+        recorded.update(stamp)
+        touched = True
+    return True, touched
+
+
+def _build(data_path, cache_path, assets_df, missions_df, shocks, binary):
+    market = load_market_data(data_path, assets_df)
+    os.makedirs(cache_path, exist_ok=True)
+    # 先写临时文件再改名，多个 worker 同时重建也不会读到写了一半的文件
+    prefix = os.path.join(cache_path, "prices")
+    tmp = f"{prefix}.{os.getpid()}.tmp"
+    suffixes = []
+    if not binary:
+        market.save(tmp)
+        suffixes += [".npy", ".json"]
+    if shocks:
+        # 叠加任务冲击后的矩阵也一起缓存，启动时不用重新计算
+        apply_mission_shocks(market, missions_df)
+        with open(f"{tmp}.adjusted.npy", "wb") as f:
+            np.save(f, market.prices)
+        suffixes.append(".adjusted.npy")
+    for suffix in suffixes:
+        os.replace(f"{tmp}{suffix}", f"{prefix}{suffix}")
+    return market
+
+
+def _write_manifest(path, manifest):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+
+
+def _open(data_path, cache_path, shocks, binary):
+    prefix = os.path.join(cache_path, "prices")
+    market = MarketData.load(os.path.join(data_path, "mock_market_prices") if binary else prefix)
+    if shocks:
+        market.prices = np.asarray(np.load(f"{prefix}.adjusted.npy", mmap_mode="r"))
+    return market
+
+
+def _load_direct(data_path, assets_df, missions_df, shocks):
+    market = load_market_data(data_path, assets_df)
+    return apply_mission_shocks(market, missions_df) if shocks else market
+
+
+def load_market(data_path='data/', use_cache=True):
+    """返回 (assets_df, missions_df, market)，market.prices 是游戏读取的价格
+
+    数据目录的 market_info.json 标明价格里还没有任务行情时 (生成的数据)，prices 已叠加任务冲击；
+    自带的 CSV 已经包含任务行情，直接使用。
+
+    价格来自 CSV 时编译到 data_path/.cache/ 下并内存映射读取；源文件变化后自动重建。
+    data_path 里直接放了二进制价格 (mock_market_prices.npy) 时原始价格直接映射，
+    需要叠加任务冲击时只把叠加后的矩阵缓存到 .cache/ 下，同样按源文件状态重建。
+    """
+    assets_df = pd.read_csv(os.path.join(data_path, "mock_assets.csv"))
+    missions_df = pd.read_csv(os.path.join(data_path, "missions_catalog.csv"))
+    shocks = shocks_pending(data_path)
+    binary = os.path.exists(os.path.join(data_path, "mock_market_prices.npy"))
+    if not use_cache or (binary and not shocks):
+        return assets_df, missions_df, _load_direct(data_path, assets_df, missions_df, shocks)
+
+    source_names = BINARY_SOURCES if binary else SOURCES
+    cache_path = os.path.join(data_path, CACHE_DIR)
+    manifest_path = os.path.join(cache_path, "manifest.json")
+    manifest = _read_manifest(manifest_path)
+    fresh, touched = _is_fresh(manifest, data_path, shocks, source_names)
+    if fresh:
+        try:
+            market = _open(data_path, cache_path, shocks, binary)
+            if touched:
+                _write_manifest(manifest_path, manifest)
+            return assets_df, missions_df, market
+        except (OSError, ValueError) as e:
+            print(f"Market cache unreadable, rebuilding: {e}")
+
+    # 先记录源文件状态再编译：编译期间源文件又被修改的话，下次启动会再重建一次
+    sources = {}
+    for name in source_names:
+        path = os.path.join(data_path, name)
+        sources[name] = {**_stamp(path), "sha256": _file_hash(path)}
+    try:
+        _build(data_path, cache_path, assets_df, missions_df, shocks, binary)
+        _write_manifest(manifest_path, {"version": CACHE_VERSION, "sources": sources, "mission_shocks": shocks})
+        return assets_df, missions_df, _open(data_path, cache_path, shocks, binary)
+    except OSError as e:
+        # 数据目录只读等情况：退回到直接读取源文件，在进程内叠加冲击
+        print(f"Could not write market cache to '{cache_path}': {e}")
+        return assets_df, missions_df, _load_direct(data_path, assets_df, missions_df, shocks)
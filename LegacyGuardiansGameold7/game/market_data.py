@@ -0,0 +1,152 @@
+# game/market_data.py
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# 二进制格式：<prefix>.npy 是原始价格矩阵 (可内存映射)，<prefix>.json 是股票、日期和板块等元数据
+BINARY_FORMAT_VERSION = 1
+
+
+class MarketData:
+    """列式行情数据：价格矩阵 (天数 × 股票)，附带 股票→列号 索引和日期数组"""
+
+    def __init__(self, prices_df, assets_df=None):
+        tickers = [c for c in prices_df.columns if c != "date"]
+        # 板块信息：ticker_sector[列号] = 板块编号，未知板块为 -1
+        sectors = []
+        ticker_sector = np.full(len(tickers), -1, dtype=np.int64)
+        if assets_df is not None:
+            sector_of = dict(zip(assets_df["ticker"], assets_df["sector"]))
+            sectors = sorted({sector_of[t] for t in tickers if t in sector_of})
+            sector_index = {s: i for i, s in enumerate(sectors)}
+            for col, ticker in enumerate(tickers):
+                if ticker in sector_of:
+                    ticker_sector[col] = sector_index[sector_of[ticker]]
+        self._setup(tickers, prices_df["date"].astype(str).to_numpy(),
+                    prices_df[tickers].to_numpy(dtype=np.float64), sectors, ticker_sector)
+
+    @classmethod
+    def from_arrays(cls, tickers, dates, base_prices, sectors=(), ticker_sector=None, prices=None):
+        """直接用数组构建 (不经过 pandas)，例如共享内存或二进制缓存里的价格矩阵"""
+        market = cls.__new__(cls)
+        if ticker_sector is None:
+            ticker_sector = np.full(len(tickers), -1, dtype=np.int64)
+        market._setup(list(tickers), np.asarray(dates), base_prices, list(sectors), np.asarray(ticker_sector, dtype=np.int64))
+        if prices is not None:
+            market.prices = prices
+        return market
+
+    def save(self, prefix):
+        """把原始价格矩阵和元数据写成二进制格式"""
+        np.save(f"{prefix}.npy", np.ascontiguousarray(self.base_prices, dtype=np.float64))
+        meta = {
+            "format": BINARY_FORMAT_VERSION,
+            "tickers": self.tickers,
+            "dates": self.dates.tolist(),
+            "sectors": self.sectors,
+            "ticker_sector": self.ticker_sector.tolist(),
+        }
+        with open(f"{prefix}.json", "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, prefix, mmap_mode="r"):
+        """读取 save() 写出的文件；默认只读内存映射价格矩阵，不复制到进程私有内存"""
+        with open(f"{prefix}.json") as f:
+            meta = json.load(f)
+        if meta.get("format") != BINARY_FORMAT_VERSION:
+            raise ValueError(f"Unsupported market data format version: {meta.get('format')}")
+        # np.asarray 去掉 memmap 子类，之后的切片和运算都是普通 ndarray (仍然指向映射的页面)
+        prices = np.asarray(np.load(f"{prefix}.npy", mmap_mode=mmap_mode))
+        return cls.from_arrays(meta["tickers"], np.array(meta["dates"]), prices, meta["sectors"], meta["ticker_sector"])
+
+    def _setup(self, tickers, dates, base_prices, sectors, ticker_sector):
+        self.tickers = tickers
+        self.ticker_index = {t: i for i, t in enumerate(tickers)}
+        self.dates = dates
+        # base_prices 是 CSV 原始价格；prices 是游戏实际读取的价格 (可能叠加了任务冲击)
+        self.base_prices = base_prices if base_prices.flags.c_contiguous else np.ascontiguousarray(base_prices)
+        self.prices = self.base_prices
+        self.sectors = sectors
+        self.ticker_sector = ticker_sector
+        # 板块成员矩阵 (板块 × 股票)，sector_matrix @ 持仓市值 = 各板块市值
+        self.sector_matrix = np.zeros((len(sectors), len(tickers)), dtype=np.float64)
+        known = ticker_sector >= 0
+        self.sector_matrix[ticker_sector[known], np.flatnonzero(known)] = 1.0
+
+    def __len__(self):
+        return self.prices.shape[0]
+
+    @property
+    def num_days(self):
+        return self.prices.shape[0]
+
+    def column_of(self, ticker):
+        """返回股票所在列号，未知股票返回 None"""
+        return self.ticker_index.get(ticker)
+
+    def price(self, day, ticker):
+        """O(1) 读取某天某只股票的价格，未知股票返回 None"""
+        col = self.ticker_index.get(ticker)
+        if col is None:
+            return None
+        return float(self.prices[day, col])
+
+    def date(self, day):
+        return str(self.dates[day])
+
+    def row(self, day):
+        """某一天所有股票的价格 (只读视图)"""
+        return self.prices[day]
+
+    def column(self, ticker, start=0, stop=None):
+        """某只股票在 [start, stop) 天内的价格序列 (视图)"""
+        return self.prices[start:stop, self.ticker_index[ticker]]
+
+    def price_map(self, day):
+        """某一天的 {ticker: price} 字典，用于需要按名称遍历的场景"""
+        return dict(zip(self.tickers, self.prices[day].tolist()))
+
+    def holdings_vector(self, holdings):
+        """把 {ticker: 数量} 转成按列对齐的持仓向量，忽略 "_cash" 和未知股票"""
+        vec = np.zeros(len(self.tickers), dtype=np.float64)
+        for ticker, quantity in holdings.items():
+            col = self.ticker_index.get(ticker)
+            if col is not None:
+                vec[col] = quantity
+        return vec
+
+    def portfolio_values(self, holdings_vec, cash, start=0, stop=None, step=1):
+        """批量估值：价格矩阵切片 × 持仓向量 + 现金，一次矩阵-向量乘法得到整条价值曲线"""
+        return self.prices[start:stop:step] @ holdings_vec + cash
+
+
+class AssetCatalog:
+    """资产目录：加载时从 assets_df 构建一次，请求路径上只读这里的列表，不再访问 DataFrame
+
+    columns[i] 是第 i 个资产在 MarketData 里的列号 (行情里没有的资产为 None)。
+    """
+
+    def __init__(self, assets_df, market):
+        self.tickers = assets_df["ticker"].astype(str).tolist()
+        self.names = assets_df["name"].astype(str).tolist()
+        self.sectors = assets_df["sector"].astype(str).tolist()
+        self.columns = [market.column_of(t) for t in self.tickers]
+        self.by_ticker = {
+            t: {"ticker": t, "name": n, "sector": s} for t, n, s in zip(self.tickers, self.names, self.sectors)
+        }
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def name(self, ticker):
+        return self.by_ticker[ticker]["name"]
+
+
+def load_market_data(data_path, assets_df=None):
+    """读取 data_path 下的价格：有 mock_market_prices.npy (二进制格式) 时直接映射，否则解析 CSV"""
+    prefix = os.path.join(data_path, "mock_market_prices")
+    if os.path.exists(f"{prefix}.npy"):
+        return MarketData.load(prefix)
+    return MarketData(pd.read_csv(f"{prefix}.csv"), assets_df)
@@ -0,0 +1,69 @@
+# game/market_events.py
+import json
+import os
+import numpy as np
+from game.missions import parse_effect_days
+
+# 数据目录里的说明文件：{"apply_mission_shocks": true} 表示价格里还没有任务行情，加载时需要叠加冲击
+# (tools/generate_market.py 生成的数据)；没有这个文件时 (例如自带的 mock_market_prices.csv) 价格里已经包含了任务行情
+MARKET_INFO = "market_info.json"
+
+
+def shocks_pending(data_path):
+    """data_path 下的价格是否还需要叠加任务冲击"""
+    try:
+        with open(os.path.join(data_path, MARKET_INFO)) as f:
+            return bool(json.load(f).get("apply_mission_shocks"))
+    except FileNotFoundError:
+        return False
+
+
+def write_market_info(data_path, apply_mission_shocks):
+    with open(os.path.join(data_path, MARKET_INFO), "w") as f:
+        json.dump({"apply_mission_shocks": apply_mission_shocks}, f)
+
+
+def mission_shock_table(missions_df, sectors):
+    """把任务目录展开成 (天, 板块编号, 冲击) 三列数组，未知板块的任务会被忽略
+
+    任务有多个 effect_days 时冲击只在第一个生效日叠加一次，之后的天数只是任务持续显示。
+    """
+    sector_index = {s: i for i, s in enumerate(sectors)}
+    days, sector_ids, shocks = [], [], []
+    if missions_df is None:
+        return np.array(days, dtype=np.int64), np.array(sector_ids, dtype=np.int64), np.array(shocks)
+    for record in missions_df.to_dict('records'):
+        sector_id = sector_index.get(record.get("sector"))
+        shock = record.get("shock")
+        if sector_id is None or shock is None or shock != shock:  # shock != shock 过滤 NaN
+            continue
+        effect_days = parse_effect_days(record.get("effect_days", "[]"))
+        if not effect_days:
+            continue
+        days.append(min(effect_days))
+        sector_ids.append(sector_id)
+        shocks.append(float(shock))
+    return np.array(days, dtype=np.int64), np.array(sector_ids, dtype=np.int64), np.array(shocks, dtype=np.float64)
+
+
+def shock_multipliers(num_days, ticker_sector, num_sectors, days, sector_ids, shocks):
+    """计算 (天数 × 股票) 的价格乘数矩阵
+
+    每个冲击在生效当天把该板块所有股票乘以 (1 + shock)，并一直保留到之后的每一天。
+    在对数空间里累加 (np.add.at + cumsum)，再按板块编号广播到各股票列。
+    """
+    valid = (days >= 0) & (days < num_days) & (shocks > -1)
+    log_shock = np.zeros((num_days, num_sectors + 1), dtype=np.float64)
+    np.add.at(log_shock, (days[valid], sector_ids[valid]), np.log1p(shocks[valid]))
+    np.cumsum(log_shock, axis=0, out=log_shock)
+    # 最后一列全为 0，给没有板块 (编号 -1) 的股票使用
+    return np.exp(log_shock[:, ticker_sector])
+
+
+def apply_mission_shocks(market, missions_df):
+    """启动时预计算叠加任务冲击后的价格矩阵，之后每次请求读价格都没有额外开销"""
+    days, sector_ids, shocks = mission_shock_table(missions_df, market.sectors)
+    multipliers = shock_multipliers(market.num_days, market.ticker_sector, len(market.sectors),
+                                    days, sector_ids, shocks)
+    market.prices = np.ascontiguousarray(market.base_prices * multipliers)
+    return market
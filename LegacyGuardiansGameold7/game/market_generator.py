@@ -0,0 +1,95 @@
+# game/market_generator.py
+# 合成行情生成器：按 mock_assets.csv 的 板块/起始价 生成带板块相关性的几何布朗运动价格路径
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from game.market_data import MarketData
+from game.market_events import write_market_info
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def expand_assets(assets_df, num_tickers):
+    """把资产表扩充到 num_tickers 只股票：按原表循环复制，新股票沿用原股票的板块和起始价"""
+    if num_tickers is None:
+        num_tickers = len(assets_df)
+    if num_tickers <= len(assets_df):
+        return assets_df.head(num_tickers).reset_index(drop=True)
+    rows = assets_df.to_dict('records')
+    expanded = list(rows)
+    for i in range(len(rows), num_tickers):
+        base = rows[i % len(rows)]
+        copy = i // len(rows)
+        expanded.append({**base, "ticker": f"{base['ticker']}_{copy}", "name": f"{base['name']} {copy}"})
+    return pd.DataFrame(expanded, columns=assets_df.columns)
+
+
+def generate_prices(start_prices, ticker_sector, num_sectors, num_days, seed=None, drift=0.05, volatility=0.3,
+                    market_weight=0.3, sector_weight=0.5):
+    """生成 (天数 × 股票) 的价格矩阵，第 0 天等于起始价
+
+    每天的冲击由三部分叠加：全市场因子、板块因子、个股噪声。
+    market_weight 是不同板块之间的相关系数，sector_weight 是同板块股票之间的相关系数。
+    ticker_sector 为 -1 的股票只受全市场因子影响。
+    """
+    rng = np.random.default_rng(seed)
+    steps = max(num_days - 1, 0)
+    num_tickers = len(start_prices)
+    dt = 1.0 / TRADING_DAYS_PER_YEAR
+
+    market = rng.standard_normal((steps, 1))
+    # 板块因子 = 全市场因子 + 板块独有部分；最后一列留给未知板块 (下标 -1)，只含全市场因子
+    factors = np.empty((steps, num_sectors + 1))
+    factors[:, :num_sectors] = rng.standard_normal((steps, num_sectors))
+    factors[:, :num_sectors] *= np.sqrt(1 - market_weight)
+    factors[:, :num_sectors] += np.sqrt(market_weight) * market
+    factors[:, num_sectors] = market[:, 0]
+
+    shocks = rng.standard_normal((steps, num_tickers))
+    shocks *= np.sqrt(1 - sector_weight)
+    shocks += np.sqrt(sector_weight) * factors[:, ticker_sector]
+
+    # 对数收益率累加后取指数
+    log_prices = np.empty((num_days, num_tickers))
+    log_prices[0] = np.log(start_prices)
+    log_prices[1:] = shocks
+    log_prices[1:] *= volatility * np.sqrt(dt)
+    log_prices[1:] += (drift - 0.5 * volatility ** 2) * dt
+    np.cumsum(log_prices, axis=0, out=log_prices)
+    return np.exp(log_prices, out=log_prices)
+
+
+def generate_market(assets_df, num_days, num_tickers=None, seed=None, start_date="2025-08-24", **params):
+    """返回 (扩充后的资产表, MarketData)，params 传给 generate_prices"""
+    assets_df = expand_assets(assets_df, num_tickers)
+    sectors = sorted(set(assets_df["sector"]))
+    sector_index = {s: i for i, s in enumerate(sectors)}
+    ticker_sector = np.array([sector_index[s] for s in assets_df["sector"]], dtype=np.int64)
+    prices = generate_prices(assets_df["start_price"].to_numpy(dtype=np.float64), ticker_sector, len(sectors),
+                             num_days, seed, **params)
+    dates = np.arange(np.datetime64(start_date), np.datetime64(start_date) + num_days).astype(str)
+    return assets_df, MarketData.from_arrays(assets_df["ticker"].tolist(), dates, prices, sectors, ticker_sector)
+
+
+def write_market(out_path, assets_df, market, fmt="csv", missions_path=None):
+    """按游戏读取的目录布局写出数据
+
+    fmt="csv" 写 mock_market_prices.csv；fmt="binary" 写 mock_market_prices.npy/.json，GameManager 会优先读取。
+    资产表总是写成 CSV；missions_path 给出时把任务目录一起复制过去。
+    生成的价格里没有任务行情，market_info.json 标明加载时需要叠加任务冲击。
+    """
+    os.makedirs(out_path, exist_ok=True)
+    assets_df.to_csv(os.path.join(out_path, "mock_assets.csv"), index=False)
+    prices_prefix = os.path.join(out_path, "mock_market_prices")
+    if fmt == "binary":
+        market.save(prices_prefix)
+    elif fmt == "csv":
+        prices_df = pd.DataFrame(market.base_prices, columns=market.tickers)
+        prices_df.insert(0, "date", market.dates)
+        prices_df.to_csv(f"{prices_prefix}.csv", index=False)
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+    if missions_path is not None and os.path.exists(missions_path):
+        shutil.copyfile(missions_path, os.path.join(out_path, "missions_catalog.csv"))
+    write_market_info(out_path, True)
@@ -0,0 +1,112 @@
+# game/metrics.py
+# 轻量级埋点：按路由和处理阶段统计耗时直方图，以 Prometheus 文本格式导出 (/metrics)
+import bisect
+import threading
+import time
+
+# 秒；覆盖从几十微秒的内存操作到几十秒的 AI 调用
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{name}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Timer:
+    # 比 contextmanager 生成器开销小，埋在每个请求的热路径上
+    __slots__ = ("histogram", "labelvalues", "started")
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+
+
+class Histogram:
+    """带标签的累积直方图，线程安全"""
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # 标签值元组 -> [各桶计数..., 总和, 总数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, *labelvalues):
+        """with histogram.time(标签...): 统计代码块耗时"""
+        return _Timer(self, labelvalues)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labelvalues, counts in sorted(series.items()):
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(counts[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {counts[-1]}")
+        return "\n".join(lines)
+
+
+REQUEST_SECONDS = Histogram("lg_request_duration_seconds", "HTTP request latency by route.",
+                            ("route", "method", "status"))
+STAGE_SECONDS = Histogram("lg_stage_duration_seconds", "Latency of internal processing stages.", ("stage",))
+
+
+def stage(name):
+    """with metrics.stage("valuation"): ... 统计一个处理阶段的耗时"""
+    return STAGE_SECONDS.time(name)
+
+
+def observe_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, name)
+
+
+def render_samples(metrics):
+    """metrics: [(名称, 类型 gauge/counter, 说明, [(标签字典, 数值), ...]), ...]"""
+    lines = []
+    for name, kind, help, samples in metrics:
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples]
+    return "\n".join(lines)
+
+
+def render(metrics=()):
+    """Prometheus 文本格式 (text/plain; version=0.0.4)：两个耗时直方图 + 调用方提供的当前数值"""
+    parts = [REQUEST_SECONDS.render(), STAGE_SECONDS.render()]
+    if metrics:
+        parts.append(render_samples(metrics))
+    return "\n".join(parts) + "\n"
@@ -0,0 +1,27 @@
+# game/missions.py
+import json
+
+
+def parse_effect_days(value):
+    """把 "[10, 11]" / "[20]" / "35" 这样的 effect_days 字段解析成整数列表"""
+    if isinstance(value, (int, float)):
+        return [int(value)]
+    text = str(value).strip()
+    try:
+        days = json.loads(text)
+    except ValueError:
+        days = [d for d in text.strip("[]").split(",") if d.strip()]
+    if not isinstance(days, list):
+        days = [days]
+    return [int(d) for d in days]
+
+
+def index_missions_by_day(missions_df):
+    """加载时把任务目录一次性展开成 {day: [任务记录, ...]}，请求时 O(1) 取当天任务"""
+    by_day = {}
+    if missions_df is None:
+        return by_day
+    for record in missions_df.to_dict('records'):
+        for day in parse_effect_days(record.get("effect_days", "[]")):
+            by_day.setdefault(day, []).append(record)
+    return by_day
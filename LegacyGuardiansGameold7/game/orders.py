@@ -0,0 +1,52 @@
+# game/orders.py
+import numpy as np
+from game import portfolio_history
+
+# 单条指令和同一资产汇总后的数量上限：远小于 int64 上限，累加和乘以价格都不会溢出
+MAX_QUANTITY = 10 ** 9
+
+
+def parse_orders(orders, market, allowed_tickers=None, default_ticker=None):
+    """把一组买卖指令汇总成按列对齐的净持仓变化向量
+
+    返回 (delta, None)；有任何一条指令无效时返回 (None, 错误信息)。
+    """
+    if not isinstance(orders, list) or not orders:
+        return None, "orders must be a non-empty list"
+    delta = np.zeros(len(market.tickers), dtype=np.int64)
+    for i, order in enumerate(orders):
+        if not isinstance(order, dict):
+            return None, f"Order {i + 1}: invalid order"
+        action = order.get("action")
+        if action not in ("buy", "sell"):
+            return None, f"Order {i + 1}: unknown action"
+        ticker = order.get("ticker", default_ticker)
+        # 列表、字典这类 JSON 值不能用来查字典
+        col = market.column_of(ticker) if isinstance(ticker, str) else None
+        if col is None or (allowed_tickers is not None and ticker not in allowed_tickers):
+            return None, f"Order {i + 1}: invalid ticker"
+        try:
+            quantity = int(order.get("quantity"))
+            if not 0 < quantity <= MAX_QUANTITY: raise ValueError
+        except (ValueError, TypeError, OverflowError):
+            return None, f"Order {i + 1}: invalid quantity"
+        net = int(delta[col]) + (quantity if action == "buy" else -quantity)
+        if abs(net) > MAX_QUANTITY:
+            return None, f"Order {i + 1}: invalid quantity"
+        delta[col] = net
+    return delta, None
+
+
+def apply_orders(session_data, delta, market):
+    """按当天价格一次性结算整批指令：现金和持仓都够时全部成交，否则一条都不成交"""
+    prices = market.row(session_data.day)
+    new_holdings = session_data.holdings + delta
+    if (new_holdings < 0).any():
+        return {"success": False, "message": "Insufficient holdings"}
+    new_cash = session_data.cash - float(delta @ prices)
+    if new_cash < 0:
+        return {"success": False, "message": "Insufficient cash"}
+    session_data.holdings[:] = new_holdings
+    session_data.cash = new_cash
+    portfolio_history.record(session_data, market)
+    return {"success": True, "message": f"{int(np.count_nonzero(delta))} positions updated."}
@@ -0,0 +1,89 @@
+# game/portfolio_history.py
+import numpy as np
+
+
+class PortfolioHistory:
+    """追加式持仓日志：每天收盘的组合价值，以及持仓发生变化那些天的现金 + 持仓
+
+    持仓只在变化的那天存一行 (稀疏)，其余天数沿用上一次变化，内存随交易次数而不是 天数 × 股票数 增长；
+    每天的组合价值按天连续存放，画图时直接切片。
+    """
+
+    def __init__(self, num_tickers, capacity=16):
+        self.size = 0  # 覆盖的天数
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.changes = 0  # 持仓变化点的个数
+        self.change_days = np.empty(4, dtype=np.int32)
+        self.cash = np.empty(4, dtype=np.float64)
+        self.holdings = np.empty((4, num_tickers), dtype=np.int64)
+
+    @property
+    def last_day(self):
+        return self.size - 1
+
+    def _reserve(self, size):
+        capacity = max(len(self.values), 1)
+        if size <= len(self.values):
+            return
+        while capacity < size:
+            capacity *= 2
+        self.values = np.resize(self.values, capacity)
+
+    def _add_change(self, day):
+        k = self.changes
+        if k == len(self.change_days):
+            capacity = max(2 * k, 4)
+            self.change_days = np.resize(self.change_days, capacity)
+            self.cash = np.resize(self.cash, capacity)
+            self.holdings = np.resize(self.holdings, (capacity, self.holdings.shape[1]))
+        self.change_days[k] = day
+        self.changes = k + 1
+        return k
+
+    def record(self, day, cash, holdings_vec, market):
+        """写入第 day 天的快照：同一天重复写入会覆盖，跳过的天数沿用上一条快照"""
+        if day < self.size - 1:
+            return
+        k = self.changes - 1
+        if day >= self.size:
+            self._reserve(day + 1)
+            if self.size > 0 and day > self.size:
+                # 中间没有操作的天数：持仓不变，按当天价格批量估值
+                self.values[self.size:day] = market.portfolio_values(self.holdings[k], self.cash[k], self.size, day)
+            self.size = day + 1
+        if k < 0 or self.change_days[k] != day:
+            # 和上一次变化相比没有交易 (例如只是进入下一天) 就不新增一行
+            if k < 0 or self.cash[k] != cash or self.holdings[k].tobytes() != holdings_vec.tobytes():
+                k = self._add_change(day)
+                self.cash[k] = cash
+                self.holdings[k] = holdings_vec
+        else:
+            self.cash[k] = cash
+            self.holdings[k] = holdings_vec
+        # 短向量上 ndarray.dot 比 @ 的调用开销小；每次买卖和每个交易日都会走到这里
+        self.values[day] = float(market.row(day).dot(self.holdings[k])) + cash
+
+    def value_series(self, start=0, stop=None, step=1):
+        stop = self.size if stop is None else min(stop, self.size)
+        return self.values[start:stop:step]
+
+
+def record(session, market):
+    """把会话当前的现金和持仓记到持仓日志里 (不存在则新建)"""
+    history = session.history
+    if history is None:
+        history = PortfolioHistory(len(market.tickers))
+        if session.day > 0:
+            # 旧会话没有日志：用当前持仓回填之前的天数
+            history.record(0, session.cash, session.holdings, market)
+        session.history = history
+    history.record(session.day, session.cash, session.holdings, market)
+    return history
+
+
+def ensure(session, market):
+    """返回覆盖到当前天数的持仓日志"""
+    history = session.history
+    if history is None or history.last_day != session.day:
+        history = record(session, market)
+    return history
@@ -0,0 +1,71 @@
+# game/profiler.py
+# 可选的采样分析器：只在开启时运行采样线程，把慢请求的调用栈写成 collapsed stack 格式
+# (每行 "函数;函数;函数 次数")，可以直接交给 flamegraph.pl、speedscope 等工具画火焰图
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """每隔 interval 秒对正在处理请求的线程采样一次调用栈
+
+    begin()/end() 由请求钩子调用；耗时超过 slow_seconds 的请求把采样结果写到 output_dir。
+    """
+
+    def __init__(self, output_dir="profiles", slow_seconds=0.5, interval=0.005):
+        self.output_dir = output_dir
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self._watched = {}  # 线程 ID -> Counter(栈 -> 次数)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._watched:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._watched.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_collapse(frame)] += 1
+
+    def begin(self):
+        with self._lock:
+            self._ensure_thread()
+            self._watched[threading.get_ident()] = Counter()
+        return time.perf_counter()
+
+    def end(self, started, name):
+        """结束当前线程的采样；慢请求返回写出的文件路径，否则返回 None"""
+        with self._lock:
+            samples = self._watched.pop(threading.get_ident(), None)
+        elapsed = time.perf_counter() - started
+        if not samples or elapsed < self.slow_seconds:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_-]+", "_", name).strip("_") or "request"
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms-{slug}.folded")
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
@@ -0,0 +1,177 @@
+# game/push_hub.py
+# 服务器推送：会话状态变化时通过 Server-Sent Events 把增量状态推给浏览器，前端不用轮询 /api/game_state
+import asyncio
+import json
+from urllib.parse import urlsplit
+from game.async_loop import BackgroundLoop
+
+HEARTBEAT_SECONDS = 15
+MAX_HEADER_BYTES = 8192
+
+
+def _state_day(state):
+    """状态里对应 get_game_state(since_day=...) 的天数 (第三关返回的 day 从 1 开始)"""
+    day = state.get("day")
+    if day is None:
+        return None
+    return day - 1 if state["currentLevel"] == 3 else day
+
+
+class PushHub:
+    """按会话登记订阅者；GameManager 修改会话后调用 notify()，订阅者各自拉取增量状态
+
+    订阅者只在事件循环线程里读写，notify() 可以在任何线程调用。
+    同一个订阅者在推送之前收到多次通知只会推送一次 (合并成最新状态)。
+    """
+
+    def __init__(self, get_manager, runtime=None, heartbeat=HEARTBEAT_SECONDS):
+        self.get_manager = get_manager
+        self.runtime = runtime if runtime is not None else BackgroundLoop("push-hub")
+        self.heartbeat = heartbeat
+        self._subscribers = {}  # session_id -> set(asyncio.Event)
+
+    @property
+    def connections(self):
+        return sum(len(s) for s in self._subscribers.values())
+
+    def notify(self, session_id):
+        if session_id in self._subscribers:
+            self.runtime.call_soon(self._wake, session_id)
+
+    def _wake(self, session_id):
+        for event in self._subscribers.get(session_id, ()):
+            event.set()
+
+    async def states(self, session_id):
+        """异步生成器：先产出完整状态，之后每次变化产出增量状态；空闲时按心跳间隔产出 None"""
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        changed.set()
+        self._subscribers.setdefault(session_id, set()).add(changed)
+        since_day = since_level = None
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(changed.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                changed.clear()
+                # 读取状态要拿会话锁，放到线程池里执行，不阻塞事件循环
+                state = await loop.run_in_executor(
+                    None, self.get_manager().get_game_state, session_id, since_day, since_level)
+                since_day, since_level = _state_day(state), state["currentLevel"]
+                yield state
+        finally:
+            subscribers = self._subscribers.get(session_id)
+            if subscribers is not None:
+                subscribers.discard(changed)
+                if not subscribers:
+                    del self._subscribers[session_id]
+
+
+class PushServer:
+    """基于 asyncio 的极简 SSE 服务：GET /events (会话 ID 只取自会话 cookie，不出现在 URL 和访问日志里)
+
+    每个空闲连接只是一个挂起的协程，几千个连接也几乎不占资源。
+    带凭证的跨域请求只接受 allowed_origins 里的来源 (游戏页面所在的地址)，其他来源返回 403。
+    """
+
+    def __init__(self, hub, host="127.0.0.1", port=5003, session_pattern=None, cookie_name="lg_session",
+                 allowed_origins=()):
+        self.hub = hub
+        self.host = host
+        self.port = port
+        self.session_pattern = session_pattern
+        self.cookie_name = cookie_name
+        self.allowed_origins = frozenset(allowed_origins)
+        self._server = None
+
+    def start(self):
+        """在 hub 的事件循环里开始监听，返回 concurrent.futures.Future"""
+        return self.hub.runtime.submit(self._start())
+
+    async def _start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        return self._server
+
+    async def _read_request(self, reader):
+        head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+        if len(head) > MAX_HEADER_BYTES:
+            raise ValueError("request header too large")
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, _ = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        return method, target, headers
+
+    def _session_id(self, headers):
+        session_id = None
+        for part in headers.get("cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == self.cookie_name:
+                session_id = value
+        if not session_id or (self.session_pattern is not None and not self.session_pattern.match(session_id)):
+            return None
+        return session_id
+
+    def _cors_headers(self, headers):
+        """同源请求 (没有 Origin) 不需要 CORS 头；不在白名单里的来源返回 None"""
+        origin = headers.get("origin")
+        if not origin:
+            return ""
+        if origin not in self.allowed_origins:
+            return None
+        # EventSource(withCredentials) 要求明确的来源，不能用 *
+        return f"Access-Control-Allow-Origin: {origin}\r\nAccess-Control-Allow-Credentials: true\r\nVary: Origin\r\n"
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                method, target, headers = await self._read_request(reader)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                return
+            session_id = self._session_id(headers)
+            if method != "GET" or urlsplit(target).path != "/events":
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            cors = self._cors_headers(headers)
+            if cors is None:
+                writer.write(b"HTTP/1.1 403 Forbidden\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            if session_id is None:
+                writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            writer.write((
+                "HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                f"Connection: keep-alive\r\nX-Accel-Buffering: no\r\n{cors}\r\n"
+                "retry: 3000\n\n").encode())
+            await writer.drain()
+            # 浏览器关闭连接时会读到 EOF，不用等到下一次写入失败才发现
+            closed = asyncio.ensure_future(reader.read(1))
+            states = self.hub.states(session_id)
+            try:
+                while True:
+                    step = asyncio.ensure_future(anext(states))
+                    await asyncio.wait({step, closed}, return_when=asyncio.FIRST_COMPLETED)
+                    if not step.done():
+                        step.cancel()
+                        await asyncio.gather(step, return_exceptions=True)
+                        break
+                    state = step.result()
+                    if state is None:
+                        writer.write(b": ping\n\n")
+                    else:
+                        writer.write(f"event: state\ndata: {json.dumps(state)}\n\n".encode())
+                    await writer.drain()
+            finally:
+                closed.cancel()
+                # 立即注销订阅者
+                await states.aclose()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,86 @@
+# game/session.py
+import hashlib
+import json
+import struct
+import numpy as np
+from game.portfolio_history import PortfolioHistory
+
+START_MONEY = 10000.0
+
+# 序列化格式：格式版本, 行情布局指纹, 关卡, 天数, 状态版本号, 现金, 本金, 已赚利息, 股票数, 持仓日志天数, 持仓变化点个数
+_HEADER = struct.Struct("<BQBIQdddIII")
+_FORMAT_VERSION = 4
+
+
+def market_layout(market):
+    """行情布局指纹：股票代码 (按列顺序) 和天数的哈希
+
+    持仓按列号存储，换了一份股票顺序或天数不同的行情，同一份会话数据的含义就变了。
+    """
+    digest = hashlib.sha256(json.dumps([list(market.tickers), market.num_days]).encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+class GameSession:
+    """单个玩家的游戏状态
+
+    用 __slots__ 固定字段，避免每个会话一个 dict；持仓是按 MarketData 列号索引的定长数组。
+    """
+
+    __slots__ = ("level", "day", "version", "cash", "principal", "interest", "holdings", "history")
+
+    def __init__(self, num_tickers, level=1, day=0, cash=START_MONEY, principal=START_MONEY, interest=0.0,
+                 holdings=None, history=None, version=0):
+        self.level = level
+        self.day = day  # 在第一关，天数表示存款时长
+        self.version = version  # 每次状态变化加一，用于 ETag 和增量响应
+        self.cash = cash
+        self.principal = principal
+        self.interest = interest
+        self.holdings = np.zeros(num_tickers, dtype=np.int64) if holdings is None else holdings
+        self.history = history
+
+    def holdings_dict(self, tickers):
+        """{ticker: 数量}，只包含持有过的股票"""
+        return {t: int(q) for t, q in zip(tickers, self.holdings.tolist()) if q}
+
+    def to_bytes(self, layout=0):
+        """layout 是 market_layout(market)，读取时用来确认会话和行情匹配"""
+        history = self.history
+        size = history.size if history is not None else 0
+        changes = history.changes if size else 0
+        parts = [
+            _HEADER.pack(_FORMAT_VERSION, layout, self.level, self.day, self.version, self.cash, self.principal,
+                         self.interest, len(self.holdings), size, changes),
+            self.holdings.tobytes(),
+        ]
+        if size:
+            parts += [history.values[:size].tobytes(), history.change_days[:changes].tobytes(),
+                      history.cash[:changes].tobytes(), history.holdings[:changes].tobytes()]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, layout=None):
+        """layout 不为 None 时，和写入时的行情布局指纹不一致的会话同样视为无法读取 (ValueError)"""
+        if data[0] != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported session format version: {data[0]}")
+        _, saved_layout, level, day, version, cash, principal, interest, num_tickers, size, changes = _HEADER.unpack_from(data)
+        if layout is not None and saved_layout != layout:
+            raise ValueError("Session was saved against a different market layout")
+        offset = _HEADER.size
+        holdings = np.frombuffer(data, dtype=np.int64, count=num_tickers, offset=offset).copy()
+        offset += holdings.nbytes
+        history = None
+        if size:
+            history = PortfolioHistory(num_tickers, capacity=size)
+            history.size = size
+            history.values[:] = np.frombuffer(data, dtype=np.float64, count=size, offset=offset)
+            offset += size * 8
+            history.change_days = np.frombuffer(data, dtype=np.int32, count=changes, offset=offset).copy()
+            offset += changes * 4
+            history.cash = np.frombuffer(data, dtype=np.float64, count=changes, offset=offset).copy()
+            offset += changes * 8
+            history.holdings = np.frombuffer(data, dtype=np.int64, count=changes * num_tickers,
+                                             offset=offset).reshape(changes, num_tickers).copy()
+            history.changes = changes
+        return cls(num_tickers, level, day, cash, principal, interest, holdings, history, version)
@@ -0,0 +1,227 @@
+# game/session_store.py
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from game.session import GameSession
+
+
+class SessionStore:
+    """会话存储接口：GameManager 只通过这些方法读写会话
+
+    on_evict(session_id) 在会话被删除、淘汰或过期时调用 (例如把它移出排行榜)。
+    layout 是当前行情的 session.market_layout()，序列化保存会话的存储用它拒绝为别的行情保存的会话。
+    """
+
+    on_evict = None
+    layout = None
+
+    def get(self, session_id):
+        """返回会话，不存在 (或已过期) 时返回 None"""
+        raise NotImplementedError
+
+    def put(self, session_id, session):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def session_ids(self):
+        raise NotImplementedError
+
+    def lock(self, session_id, write=True):
+        """返回一个上下文管理器，持有期间独占该会话 (可重入)
+
+        write=False 表示持有期间只读取会话，存储可以不为它开启写事务。
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        return len(self.session_ids())
+
+
+class _SessionLocks:
+    """按会话 ID 分配的可重入锁；没人持有引用时自动回收"""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = weakref.WeakValueDictionary()
+
+    def get(self, session_id):
+        with self._guard:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = _RLock()
+                self._locks[session_id] = lock
+            return lock
+
+
+class _RLock:
+    """threading.RLock 不支持弱引用，这里包一层"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+class InMemorySessionStore(SessionStore):
+    """进程内会话存储：按会话加锁，容量有上限 (LRU 淘汰)，空闲超过 ttl 秒自动过期"""
+
+    def __init__(self, capacity=10000, ttl=3600):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # session_id -> (session, last_access)，按访问时间排序
+        self._guard = threading.Lock()
+        self._locks = _SessionLocks()
+
+    def _evict(self):
+        # 在 _guard 内回调：同一会话随后重新创建时，put 一定排在这次回调之后
+        session_id, _ = self._sessions.popitem(last=False)
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+
+    def _expire(self, now):
+        # 最久未访问的会话在最前面，过期的只会出现在头部
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access <= self.ttl:
+                break
+            self._evict()
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._guard:
+            if self.ttl is not None:
+                self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], now)
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def put(self, session_id, session):
+        now = time.monotonic()
+        with self._guard:
+            self._sessions[session_id] = (session, now)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.capacity:
+                self._evict()
+
+    def delete(self, session_id):
+        with self._guard:
+            if self._sessions.pop(session_id, None) is not None and self.on_evict is not None:
+                self.on_evict(session_id)
+
+    def session_ids(self):
+        with self._guard:
+            return list(self._sessions)
+
+    def lock(self, session_id, write=True):
+        return self._locks.get(session_id)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """本地 SQLite 会话存储：重启后状态仍在，多个 worker 进程可以共享同一个数据库文件
+
+    lock() 在进程内按会话加锁；写锁同时开启 BEGIN IMMEDIATE 事务，跨进程串行化写入。
+    读锁 (write=False) 不开事务：读取只是一条 SELECT，轮询状态不会占用数据库的写锁。
+    ttl 从最后一次写入算起，只读取不会延长会话。on_evict 只会收到本进程删除的会话，
+    其他 worker 删除或修改的会话本进程不会得到通知。
+    """
+
+    def __init__(self, path="sessions.db", ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._locks = _SessionLocks()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.depth = 0
+        return conn
+
+    def dumps(self, session):
+        return session.to_bytes(self.layout or 0)
+
+    def loads(self, data):
+        return GameSession.from_bytes(data, self.layout)
+
+    def get(self, session_id):
+        row = self._conn().execute("SELECT data, updated FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        if self.ttl is not None and time.time() - row[1] > self.ttl:
+            self.delete(session_id)
+            return None
+        try:
+            return self.loads(row[0])
+        except ValueError:
+            # 旧格式或为别的行情保存的会话无法读取，当作不存在重新开始
+            return None
+
+    def put(self, session_id, session):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO sessions (id, data, updated) VALUES (?, ?, ?)",
+                     (session_id, self.dumps(session), now))
+        if self.ttl is not None:
+            expired = conn.execute("DELETE FROM sessions WHERE updated < ? RETURNING id", (now - self.ttl,)).fetchall()
+            if self.on_evict is not None:
+                for (expired_id,) in expired:
+                    self.on_evict(expired_id)
+
+    def delete(self, session_id):
+        self._conn().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+
+    def session_ids(self):
+        return [row[0] for row in self._conn().execute("SELECT id FROM sessions")]
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    @contextmanager
+    def lock(self, session_id, write=True):
+        with self._locks.get(session_id):
+            if not write:
+                # 读锁里如果需要写 (例如创建新会话)，内层再取写锁，届时才开启事务
+                yield self
+                return
+            conn = self._conn()
+            outermost = self._local.depth == 0
+            if outermost:
+                conn.execute("BEGIN IMMEDIATE")
+            self._local.depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._local.depth -= 1
+                if outermost:
+                    conn.execute("ROLLBACK")
+                raise
+            self._local.depth -= 1
+            if outermost:
+                conn.execute("COMMIT")
@@ -0,0 +1,243 @@
+# game/simulation.py
+# 无界面模拟引擎：在内存会话上直接跑第二、三关的规则，用进程池批量回测交易策略
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from game import level_one_banking, level_two_stock, level_three_portfolio, portfolio_history
+from game.market_data import MarketData
+from game.session import GameSession, START_MONEY
+
+LEVELS = {2: level_two_stock, 3: level_three_portfolio}
+
+
+# --- 策略 ---
+# 策略每天被调用一次：strategy(session, market, tradable, rng) -> 当天的买卖指令列表 (空列表表示等待)
+
+def hold(session, market, tradable, rng):
+    """一直持有现金"""
+    return []
+
+
+def buy_and_hold(session, market, tradable, rng):
+    """第 0 天把现金平均分到可交易的股票上，然后一直持有"""
+    if session.day != 0:
+        return []
+    budget = session.cash / len(tradable)
+    orders = []
+    for ticker in tradable:
+        quantity = int(budget // market.price(session.day, ticker))
+        if quantity > 0:
+            orders.append({"action": "buy", "ticker": ticker, "quantity": quantity})
+    return orders
+
+
+def random_trader(session, market, tradable, rng, trade_probability=0.3):
+    """每天以一定概率随机买或卖一只股票"""
+    if rng.random() >= trade_probability:
+        return []
+    ticker = rng.choice(tradable)
+    col = market.column_of(ticker)
+    if rng.random() < 0.5:
+        affordable = int(session.cash // market.price(session.day, ticker))
+        if affordable > 0:
+            return [{"action": "buy", "ticker": ticker, "quantity": rng.randint(1, affordable)}]
+    elif session.holdings[col] > 0:
+        return [{"action": "sell", "ticker": ticker, "quantity": rng.randint(1, int(session.holdings[col]))}]
+    return []
+
+
+def momentum(session, market, tradable, rng):
+    """昨天涨了就用一半现金追涨，跌了就清仓"""
+    day = session.day
+    if day == 0:
+        return []
+    orders = []
+    for ticker in tradable:
+        col = market.column_of(ticker)
+        today, yesterday = market.prices[day, col], market.prices[day - 1, col]
+        if today > yesterday:
+            quantity = int(session.cash / 2 / len(tradable) // today)
+            if quantity > 0:
+                orders.append({"action": "buy", "ticker": ticker, "quantity": quantity})
+        elif today < yesterday and session.holdings[col] > 0:
+            orders.append({"action": "sell", "ticker": ticker, "quantity": int(session.holdings[col])})
+    return orders
+
+
+STRATEGIES = {
+    "hold": hold,
+    "buy_and_hold": buy_and_hold,
+    "random": random_trader,
+    "momentum": momentum,
+}
+
+
+# --- 单局 ---
+
+def advance_level(session, market):
+    """晋级到下一关 (GameManager.advance_level 和日志回放共用这条规则)"""
+    if session.level >= 3:
+        return {"success": False, "message": "You are already at the highest level!"}
+    session.level += 1
+    if session.level == 2:
+        # 第二关开始时，重置天数和资产，继承第一关的本金；持仓日志从第二关第 0 天开始记录
+        session.day = 0
+        session.cash = session.principal
+        session.holdings[:] = 0
+        session.history = None
+        portfolio_history.record(session, market)
+    # 第三关开始时，继承第二关的天数和资产，无需处理
+    return {"success": True, "newLevel": session.level}
+
+
+def apply_event(session, kind, payload, market):
+    """把一条操作日志 ("action" / "batch" / "advance") 作用到会话上，返回规则函数的结果"""
+    if kind == "action":
+        if session.level == 1:
+            return level_one_banking.handle_action(session, payload)
+        return LEVELS[session.level].handle_action(session, payload, market)
+    if kind == "batch":
+        return LEVELS[session.level].handle_batch(session, payload, market)
+    if kind == "advance":
+        return advance_level(session, market)
+    return {"success": False, "message": f"Unknown event: {kind}"}
+
+
+def new_session(market, level=2, cash=START_MONEY):
+    """跳过第一关，直接从第二关第 0 天 (或第三关) 开始的会话"""
+    session = GameSession(len(market.tickers), level=level, cash=cash, principal=cash)
+    portfolio_history.record(session, market)
+    return session
+
+
+def tradable_tickers(market, level):
+    return [level_two_stock.STOCK_TICKER] if level == 2 else list(market.tickers)
+
+
+def run_game(market, strategy, level=2, seed=0, cash=START_MONEY):
+    """用同一套关卡规则从第 0 天玩到最后一天，返回会话 (持仓日志里有每天的组合价值)"""
+    rules = LEVELS[level]
+    rng = random.Random(seed)
+    tradable = tradable_tickers(market, level)
+    session = new_session(market, level, cash)
+    last_day = len(market) - 1
+    while True:
+        day = session.day
+        orders = strategy(session, market, tradable, rng)
+        if len(orders) == 1:
+            rules.handle_action(session, orders[0], market)
+        elif orders:
+            rules.handle_batch(session, orders, market)
+        if day == last_day:
+            break
+        if session.day == day:
+            # 没有交易 (或交易没有自动进入下一天) 时等待一天
+            rules.handle_action(session, {"action": "next_day"}, market)
+    return session
+
+
+def _run_chunk(market, strategy_name, level, seeds, cash, goal):
+    strategy = STRATEGIES[strategy_name]
+    final = np.empty(len(seeds), dtype=np.float64)
+    peak = np.empty(len(seeds), dtype=np.float64)
+    for i, seed in enumerate(seeds):
+        values = run_game(market, strategy, level, seed, cash).history.value_series()
+        final[i] = values[-1]
+        peak[i] = values.max()
+    return final, peak >= goal
+
+
+# --- 进程池：价格矩阵放在共享内存里，每个 worker 启动时只附加一次 ---
+
+_worker_market = None
+_worker_shm = None
+
+
+def _init_worker(spec):
+    global _worker_market, _worker_shm
+    _worker_shm = shared_memory.SharedMemory(name=spec["shm"])
+    prices = np.ndarray(spec["shape"], dtype=np.float64, buffer=_worker_shm.buf)
+    prices.flags.writeable = False
+    _worker_market = MarketData.from_arrays(spec["tickers"], spec["dates"], prices, spec["sectors"], spec["ticker_sector"])
+
+
+def _worker_chunk(strategy_name, level, seeds, cash, goal):
+    return _run_chunk(_worker_market, strategy_name, level, seeds, cash, goal)
+
+
+def in_worker(fn, *args):
+    """在 market_pool 的 worker 里调用 fn(共享的行情, *args)；fn 必须是模块级函数"""
+    return fn(_worker_market, *args)
+
+
+@contextmanager
+def market_pool(market, workers):
+    """进程池：价格矩阵复制到共享内存，每个 worker 启动时附加一次，任务里用 in_worker 取用"""
+    shm = shared_memory.SharedMemory(create=True, size=market.prices.nbytes)
+    try:
+        np.ndarray(market.prices.shape, dtype=np.float64, buffer=shm.buf)[:] = market.prices
+        spec = {
+            "shm": shm.name, "shape": market.prices.shape, "tickers": market.tickers, "dates": market.dates,
+            "sectors": market.sectors, "ticker_sector": market.ticker_sector,
+        }
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(spec,)) as pool:
+            yield pool
+    finally:
+        # 共享内存由主进程创建和释放，worker 只是借用
+        shm.close()
+        shm.unlink()
+
+
+def summarize(final, hit, cash, elapsed):
+    returns = final / cash - 1
+    p5, p25, p50, p75, p95 = np.percentile(returns, [5, 25, 50, 75, 95]).tolist()
+    return {
+        "games": int(len(final)),
+        "goalHitRate": float(hit.mean()) if len(hit) else 0.0,
+        "finalValue": {"mean": float(final.mean()), "std": float(final.std()),
+                       "min": float(final.min()), "max": float(final.max())},
+        "return": {"mean": float(returns.mean()), "std": float(returns.std()),
+                   "p5": p5, "p25": p25, "p50": p50, "p75": p75, "p95": p95},
+        "elapsedSeconds": elapsed,
+        "gamesPerSecond": len(final) / elapsed if elapsed > 0 else None,
+    }
+
+
+def run_backtest(market, strategy="random", games=1000, level=2, workers=None, goal=level_two_stock.LEVEL_GOAL,
+                 cash=START_MONEY, seed=0):
+    """回测 games 局，返回目标达成率和收益分布
+
+    workers=1 时在当前进程里跑；否则把种子分块交给进程池，价格矩阵通过共享内存传一次。
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    if level not in LEVELS:
+        raise ValueError("Backtests are only available for Level 2 and 3.")
+    workers = workers or os.cpu_count() or 1
+    seeds = np.arange(seed, seed + games)
+    started = time.perf_counter()
+
+    if workers == 1 or games < 2:
+        final, hit = _run_chunk(market, strategy, level, seeds.tolist(), cash, goal)
+        result = summarize(final, hit, cash, time.perf_counter() - started)
+        result.update(strategy=strategy, level=level, goal=goal, workers=1)
+        return result
+
+    # 每个 worker 分几块，负载不均时能互相补位
+    chunk_size = max(1, min(1000, games // (workers * 4)))
+    with market_pool(market, workers) as pool:
+        futures = [pool.submit(_worker_chunk, strategy, level, seeds[i:i + chunk_size].tolist(), cash, goal)
+                   for i in range(0, games, chunk_size)]
+        parts = [f.result() for f in futures]
+
+    final = np.concatenate([p[0] for p in parts])
+    hit = np.concatenate([p[1] for p in parts])
+    result = summarize(final, hit, cash, time.perf_counter() - started)
+    result.update(strategy=strategy, level=level, goal=goal, workers=workers)
+    return result
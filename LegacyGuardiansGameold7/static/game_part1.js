@@ -1,5 +1,26 @@
 const API_BASE_URL = "http://127.0.0.1:5002";
     let l2PriceChart;
+    let lastState = null; // 上一次的状态，用于合并后端返回的增量数据
+
+    // 第二关已有状态时，只向后端请求新增的价格历史
+    function withSince(endpoint) {
+        if (!lastState || lastState.currentLevel !== 2) return endpoint;
+        return `${endpoint}?since=${lastState.day}&level=${lastState.currentLevel}`;
+    }
+
+    function mergeHistory(oldPoints, newPoints) {
+        if (!newPoints.length) return oldPoints;
+        const firstDate = newPoints[0].date;
+        return oldPoints.filter(p => p.date < firstDate).concat(newPoints);
+    }
+
+    function mergeState(data) {
+        if (data.delta && lastState && lastState.currentLevel === data.currentLevel) {
+            data.priceHistory = mergeHistory(lastState.priceHistory, data.priceHistory);
+        }
+        lastState = data;
+        return data;
+    }
 
     function formatCurrency(num) {
         if (typeof num !== 'number') return '$0.00';
@@ -41,6 +62,27 @@ const API_BASE_URL = "http://127.0.0.1:5002";
             optionsDiv.innerHTML += `<button onclick="performAction({action: 'deposit', period: ${opt.period}, rate: ${opt.rate}})">Save ${opt.period} days (annual rate ${opt.rate * 100}%)</button> `;
         });
         document.getElementById('l1-advance-btn').disabled = !data.isGoalMet;
+        renderProjection();
+    }
+
+    // 推演从当前本金出发最快达到目标的存款组合
+    async function renderProjection() {
+        const el = document.getElementById('l1-projection');
+        try {
+            const response = await fetch(`${API_BASE_URL}/api/level1/projection`);
+            if (!response.ok) { el.textContent = ''; return; }
+            const path = (await response.json()).fastestPath;
+            if (!path) {
+                el.textContent = 'The goal cannot be reached within two years of deposits.';
+            } else if (!path.deposits.length) {
+                el.textContent = 'You have reached the goal!';
+            } else {
+                const plan = path.deposits.map(d => `${d.period} days`).join(' + ');
+                el.textContent = `Fastest path to the goal: ${plan} (${path.days} days, ending with ${formatCurrency(path.finalPrincipal)}).`;
+            }
+        } catch (error) {
+            el.textContent = '';
+        }
     }
 
     function renderLevel2(data) {
@@ -70,7 +112,7 @@ const API_BASE_URL = "http://127.0.0.1:5002";
                 alert(`Operation failed: ${data.error || 'Unknown error'}`);
                 return null;
             }
-            const data = await response.json();
+            const data = mergeState(await response.json());
             // apiCall 仍然调用 renderGame，但新的 renderGame 不会跳转
             renderGame(data); 
             return data; // 将后端返回的数据传递出去
@@ -81,11 +123,24 @@ const API_BASE_URL = "http://127.0.0.1:5002";
         }
     }
     
-    function performAction(actionData) { apiCall('/api/perform_action', 'POST', actionData); }
+    function performAction(actionData) { apiCall(withSince('/api/perform_action'), 'POST', actionData); }
+
+    // 连接推送服务 (SSE)：老师统一推进天数等服务器端的变化会直接推过来，不需要轮询
+    async function connectPush() {
+        try {
+            const info = await (await fetch(`${API_BASE_URL}/api/push_info`)).json();
+            if (!info.enabled) return;
+            const source = new EventSource(info.url, { withCredentials: true });
+            source.addEventListener('state', e => renderGame(mergeState(JSON.parse(e.data))));
+        } catch (error) {
+            console.error("Push connection failed:", error);
+        }
+    }
 
     document.addEventListener('DOMContentLoaded', () => {
         initializeCharts();
         apiCall('/api/game_state');
+        connectPush();
 
         document.getElementById('reset-btn').addEventListener('click', () => {
             if (confirm("Are you sure you want to restart from level 1? All progress will be lost.")) {
@@ -0,0 +1,46 @@
+# tools/backtest.py
+# 批量回测交易策略，统计能达到关卡目标的比例和收益分布，用来调整难度和任务冲击
+# 用法 (在 LegacyGuardiansGameold7 目录下): python tools/backtest.py --strategy random --games 100000 --level 2
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game import level_two_stock
+from game.session import START_MONEY
+from game.market_cache import load_market
+from game.simulation import STRATEGIES, run_backtest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many headless games and report goal-hit rates.")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES) + ["all"], default="all")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--level", type=int, choices=[2, 3], default=2)
+    parser.add_argument("--workers", type=int, default=None, help="default: number of CPUs")
+    parser.add_argument("--goal", type=float, default=level_two_stock.LEVEL_GOAL)
+    parser.add_argument("--cash", type=float, default=START_MONEY)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-path", default="data/")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    _, _, market = load_market(args.data_path)
+    strategies = sorted(STRATEGIES) if args.strategy == "all" else [args.strategy]
+    results = []
+    for name in strategies:
+        result = run_backtest(market, name, args.games, args.level, args.workers, args.goal, args.cash, args.seed)
+        results.append(result)
+        r = result["return"]
+        print(f"{name:>13}: goal hit {result['goalHitRate']:7.2%}  return mean {r['mean']:+.2%}  "
+              f"p5 {r['p5']:+.2%}  p50 {r['p50']:+.2%}  p95 {r['p95']:+.2%}  "
+              f"({result['games']} games, {result['gamesPerSecond']:.0f} games/s, {result['workers']} workers)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+# tools/generate_market.py
+# 生成大规模合成行情，用来测试服务器在真实数据量下的表现
+# 用法 (在 LegacyGuardiansGameold7 目录下): python tools/generate_market.py --days 1260 --tickers 500 --seed 1 --out data_large/
+#       然后用 GameManager(data_path='data_large/') 或 tools/backtest.py --data-path data_large/ 读取
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from game.market_generator import generate_market, write_market
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic correlated GBM price paths.")
+    parser.add_argument("--assets", default="data/mock_assets.csv", help="source assets (ticker, name, sector, start_price)")
+    parser.add_argument("--missions", default="data/missions_catalog.csv", help="missions catalog copied next to the prices")
+    parser.add_argument("--days", type=int, default=252 * 5)
+    parser.add_argument("--tickers", type=int, default=None, help="default: as many as in --assets")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--start-date", default="2025-08-24")
+    parser.add_argument("--drift", type=float, default=0.05, help="annual drift")
+    parser.add_argument("--volatility", type=float, default=0.3, help="annual volatility")
+    parser.add_argument("--market-weight", type=float, default=0.3, help="correlation between sectors")
+    parser.add_argument("--sector-weight", type=float, default=0.5, help="correlation within a sector")
+    parser.add_argument("--format", choices=["csv", "binary"], default="binary")
+    parser.add_argument("--out", required=True, help="output directory")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    assets_df, market = generate_market(
+        pd.read_csv(args.assets), args.days, args.tickers, args.seed, args.start_date, drift=args.drift,
+        volatility=args.volatility, market_weight=args.market_weight, sector_weight=args.sector_weight)
+    generated = time.perf_counter()
+    write_market(args.out, assets_df, market, args.format, args.missions)
+    print(f"Generated {len(market)} days x {len(market.tickers)} tickers in {(generated - started) * 1000:.1f} ms, "
+          f"wrote {args.format} to {args.out} in {(time.perf_counter() - generated) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# tools/replay.py
+# 回放操作日志：重建整个班级的会话并统计回放速度，或者逐条列出某个会话的操作 (核对玩家申诉)
+# 用法 (在 LegacyGuardiansGameold7 目录下): python tools/replay.py action_log/ [--workers 4] [--session <会话 ID>]
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from game.action_log import LOG_NAME, ActionLog, read_records, replay_log
+from game.market_cache import load_market
+from game.session import GameSession
+from game.simulation import apply_event
+
+
+def audit(path, market, session_id):
+    """逐条回放一个会话，打印每条操作和回放后的现金、持仓"""
+    session = None
+    for record_session, version, kind, payload, stamp in read_records(path):
+        if record_session != session_id:
+            continue
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stamp))
+        if kind == "reset":
+            session = GameSession(len(market.tickers), version=version)
+            outcome = "new game"
+        elif session is None:
+            outcome = "skipped (log starts mid-game)"
+        else:
+            result = apply_event(session, kind, payload, market)
+            session.version = version
+            outcome = "ok" if result.get("success") else f"REJECTED: {result.get('message')}"
+        state = ""
+        if session is not None:
+            state = (f"level {session.level} day {session.day} cash {session.cash:.2f} "
+                     f"principal {session.principal:.2f} holdings {session.holdings_dict(market.tickers)}")
+        print(f"{when}  v{version:<5} {kind:<8} {json.dumps(payload) if payload is not None else '':<60} {outcome}  {state}")
+    if session is None:
+        print(f"No records for session {session_id}.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the action log through the headless game rules.")
+    parser.add_argument("log_dir", nargs="?", default="action_log")
+    parser.add_argument("--session", help="print the audit trail of one session")
+    parser.add_argument("--from-snapshots", action="store_true",
+                        help="start from the latest snapshots and replay only the tail (as on server start)")
+    parser.add_argument("--workers", type=int, default=1, help="partition sessions across processes")
+    parser.add_argument("--data-path", default="data/")
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    _, _, market = load_market(args.data_path)
+    path = os.path.join(args.log_dir, LOG_NAME)
+    if args.session:
+        audit(path, market, args.session)
+        return
+
+    started = time.perf_counter()
+    if args.from_snapshots:
+        log = ActionLog(args.log_dir)
+        try:
+            sessions, stats = log.recover(market, workers=args.workers)
+        finally:
+            log.close()
+    else:
+        sessions, stats = replay_log(path, market, workers=args.workers)
+    elapsed = time.perf_counter() - started
+    summary = {
+        "sessions": len(sessions),
+        "records": stats["applied"],
+        "rejected": stats["rejected"],
+        "elapsedSeconds": elapsed,
+        "recordsPerSecond": stats["applied"] / elapsed if elapsed > 0 else None,
+        "workers": args.workers,
+        "fromSnapshots": args.from_snapshots,
+    }
+    print(f"{summary['sessions']} sessions, {summary['records']} records replayed in {elapsed:.2f} s "
+          f"({summary['recordsPerSecond']:.0f} records/s, {args.workers} workers)")
+    if stats["rejected"]:
+        print(f"WARNING: {stats['rejected']} records were rejected on replay; the market data may have changed.")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()